@@ -1,16 +1,20 @@
 import os
 import requests
 import logging
+import threading
 from datetime import datetime
 import json
 import time
 from typing import Dict, Any, Optional, List
+from requests.adapters import HTTPAdapter
+from send_engine import SessionSendEngine
+from database import TenantCache
 from utils import agora_br, formatar_datetime_br
 
 logger = logging.getLogger(__name__)
 
 class BaileysAPI:
-    def __init__(self):
+    def __init__(self, number_store=None):
         self.base_url = os.getenv('BAILEYS_API_URL', 'http://localhost:3000')
         self.api_key = os.getenv('BAILEYS_API_KEY', '')
         self.default_session = os.getenv('BAILEYS_SESSION', 'bot_clientes')
@@ -19,14 +23,34 @@ class BaileysAPI:
         self.retry_delay = int(os.getenv('BAILEYS_RETRY_DELAY', '5'))
         self.message_delay = int(os.getenv('BAILEYS_MESSAGE_DELAY', '2'))
         self.auto_reconnect = os.getenv('BAILEYS_AUTO_RECONNECT', 'true').lower() == 'true'
+        self.pool_size = int(os.getenv('BAILEYS_POOL_SIZE', '16'))
         self.headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'Bot-Clientes/1.0'
         }
         if self.api_key:
             self.headers['Authorization'] = f'Bearer {self.api_key}'
-        self._status_cache = {}
-        self._cache_timeout = 300  # 5 minutos
+        # Conexões keep-alive com o servidor Node; as retentativas ficam em _make_request
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Intervalo anti-ban entre envios da mesma sessão WhatsApp, sem sleep na thread de quem envia
+        self.send_engine = SessionSendEngine(intervalo=lambda: self.message_delay)
+        # Sessão -> último status do servidor Node: eventos (/api/session/event) valem por
+        # status_push_max_age (um evento perdido não fica valendo para sempre); o status
+        # consultado na falta deles expira em status_max_age
+        self.status_max_age = int(os.getenv('BAILEYS_STATUS_MAX_AGE', '300'))
+        self.status_push_max_age = int(os.getenv('BAILEYS_STATUS_PUSH_MAX_AGE', '3600'))
+        self._status_cache = TenantCache(int(os.getenv('BAILEYS_STATUS_CACHE_MAX', '1000')),
+                                         ttl=self.status_max_age)
+        self._status_lock = threading.Lock()
+        # Número -> (registrado, jid); number_store (DatabaseManager) persiste as verificações entre deploys
+        self._number_cache = TenantCache(int(os.getenv('BAILEYS_NUMBER_CACHE_MAX', '10000')),
+                                         ttl=int(os.getenv('BAILEYS_NUMBER_CACHE_TTL', '86400')))
+        self.number_store = number_store
+        self.check_batch_size = int(os.getenv('BAILEYS_CHECK_BATCH', '200'))
         logger.info(f"Baileys API inicializada: {self.base_url}")
 
     def get_user_session(self, chat_id_usuario: int) -> str:
@@ -39,13 +63,13 @@ class BaileysAPI:
         for attempt in range(retries + 1):
             try:
                 if method.upper() == 'GET':
-                    response = requests.get(url, headers=self.headers, timeout=self.timeout, params=data)
+                    response = self.session.get(url, timeout=self.timeout, params=data)
                 elif method.upper() == 'POST':
-                    response = requests.post(url, headers=self.headers, timeout=self.timeout, json=data)
+                    response = self.session.post(url, timeout=self.timeout, json=data)
                 elif method.upper() == 'PUT':
-                    response = requests.put(url, headers=self.headers, timeout=self.timeout, json=data)
+                    response = self.session.put(url, timeout=self.timeout, json=data)
                 elif method.upper() == 'DELETE':
-                    response = requests.delete(url, headers=self.headers, timeout=self.timeout)
+                    response = self.session.delete(url, timeout=self.timeout)
                 else:
                     raise ValueError(f"Método HTTP não suportado: {method}")
                 logger.debug(f"Baileys API Request: {method} {url} - Status: {response.status_code}")
@@ -98,39 +122,29 @@ class BaileysAPI:
     def get_status(self, chat_id_usuario: int = None) -> Dict:
         try:
             session_name = self.get_user_session(chat_id_usuario) if chat_id_usuario else self.default_session
-            now = time.time()
-            cache_key = f'status_{session_name}'
-            if (cache_key in self._status_cache and 
-                now - self._status_cache.get(f'{cache_key}_timestamp', 0) < self._cache_timeout):
-                return self._status_cache[cache_key]
-            response = self._make_request(f'status/{session_name}')
-            if response.get('success'):
-                status_data = response.get('data', {})
-                status = {
-                    'status': self._format_connection_status(status_data.get('state', 'disconnected')),
-                    'numero': status_data.get('user', {}).get('id', '').replace('@s.whatsapp.net', ''),
-                    'bateria': status_data.get('battery', {}).get('percentage'),
-                    'ultima_conexao': self._format_last_seen(status_data.get('lastSeen')),
-                    'qr_needed': status_data.get('qr') is not None,
-                    'mensagens_enviadas': status_data.get('stats', {}).get('sent', 0),
-                    'mensagens_falharam': status_data.get('stats', {}).get('failed', 0),
-                    'fila_pendente': status_data.get('stats', {}).get('pending', 0)
-                }
-                self._status_cache[cache_key] = status
-                self._status_cache[f'{cache_key}_timestamp'] = now
-                return status
-            else:
-                return {
-                    'status': '🔴 Erro na conexão',
-                    'numero': 'N/A',
-                    'bateria': None,
-                    'ultima_conexao': 'N/A',
-                    'qr_needed': True,
-                    'mensagens_enviadas': 0,
-                    'mensagens_falharam': 0,
-                    'fila_pendente': 0,
-                    'error': response.get('error', 'Erro desconhecido')
-                }
+            raw = self._status_cache.get(session_name)
+            if raw is None:
+                consultado_em = time.time()
+                response = self._make_request(f'status/{session_name}')
+                if 'connected' not in response:
+                    return {
+                        'status': '🔴 Erro na conexão',
+                        'numero': 'N/A',
+                        'bateria': None,
+                        'ultima_conexao': 'N/A',
+                        'qr_needed': True,
+                        'mensagens_enviadas': 0,
+                        'mensagens_falharam': 0,
+                        'fila_pendente': 0,
+                        'error': response.get('error', 'Erro desconhecido')
+                    }
+                # Um evento recebido durante a consulta é mais novo que a resposta
+                with self._status_lock:
+                    raw = self._status_cache.peek(session_name)
+                    if raw is None or raw['received_at'] < consultado_em:
+                        raw = dict(response, received_at=consultado_em)
+                        self._status_cache.put(session_name, raw)
+            return self._format_status(raw)
         except Exception as e:
             logger.error(f"Erro ao obter status: {e}")
             return {
@@ -145,12 +159,59 @@ class BaileysAPI:
                 'error': str(e)
             }
 
+    def apply_status_event(self, event: Dict) -> bool:
+        try:
+            session_name = event.get('session_id')
+            if not session_name:
+                return False
+            with self._status_lock:
+                atual = self._status_cache.peek(session_name)
+                # Eventos do mesmo processo Node chegam fora de ordem às vezes; vale o de maior seq
+                if (atual and atual.get('boot_id') == event.get('boot_id')
+                        and (atual.get('seq') or 0) >= (event.get('seq') or 0)):
+                    return False
+                self._status_cache.put(session_name, dict(event, received_at=time.time()),
+                                       ttl=self.status_push_max_age)
+            logger.debug(f"Status da sessão {session_name}: {event.get('event')} ({event.get('status')})")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao aplicar evento de status: {e}")
+            return False
+
+    def connected_sessions(self) -> List[str]:
+        return [session_name for session_name, raw in self._status_cache.items() if raw.get('connected')]
+
+    def cache_stats(self) -> Dict:
+        return {'status': self._status_cache.stats(), 'numbers': self._number_cache.stats()}
+
+    def _format_status(self, raw: Dict) -> Dict:
+        conectado = bool(raw.get('connected'))
+        return {
+            'status': self._format_connection_status(raw.get('status') or 'disconnected'),
+            'estado': raw.get('status') or 'disconnected',
+            'connected': conectado,
+            'numero': (raw.get('session') or '').split('@')[0].split(':')[0] or 'N/A',
+            'bateria': None,
+            'ultima_conexao': self._format_last_seen(raw.get('timestamp')) if conectado else 'N/A',
+            'qr_needed': not conectado,
+            'qr_available': bool(raw.get('qr_available')),
+            'mensagens_enviadas': 0,
+            'mensagens_falharam': 0,
+            'fila_pendente': 0
+        }
+
     def _format_connection_status(self, state: str) -> str:
         status_map = {
             'open': '🟢 Conectado',
+            'connected': '🟢 Conectado',
             'connecting': '🟡 Conectando',
+            'initializing': '🟡 Conectando',
+            'pairing': '🟡 Pareando',
+            'qr_ready': '📱 Aguardando leitura do QR Code',
             'close': '🔴 Desconectado',
-            'disconnected': '🔴 Desconectado'
+            'disconnected': '🔴 Desconectado',
+            'not_initialized': '🔴 Desconectado',
+            'error': '❌ Erro na sessão'
         }
         return status_map.get(state, f'❓ {state}')
 
@@ -173,7 +234,7 @@ class BaileysAPI:
     def generate_qr_code(self, chat_id_usuario: int) -> Dict:
         try:
             session_name = self.get_user_session(chat_id_usuario)
-            response = requests.get(f"{self.base_url}/qr/{session_name}", timeout=30)
+            response = self.session.get(f"{self.base_url}/qr/{session_name}", timeout=30)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('success'):
@@ -211,12 +272,10 @@ class BaileysAPI:
             }
             if options:
                 data.update(options)
-            response = requests.post(f"{self.base_url}/send-message", json=data, timeout=30)
+            response = self.session.post(f"{self.base_url}/send-message", json=data, timeout=30)
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
-                    if self.message_delay > 0:
-                        time.sleep(self.message_delay)
                     return {
                         'success': True,
                         'messageId': result.get('messageId'),
@@ -251,9 +310,6 @@ class BaileysAPI:
             if caption:
                 data['caption'] = caption
             response = self._make_request('send-image', 'POST', data)
-            if response.get('success'):
-                if self.message_delay > 0:
-                    time.sleep(self.message_delay)
             return response
         except Exception as e:
             logger.error(f"Erro ao enviar imagem: {e}")
@@ -273,9 +329,6 @@ class BaileysAPI:
             if filename:
                 data['filename'] = filename
             response = self._make_request('send-document', 'POST', data)
-            if response.get('success'):
-                if self.message_delay > 0:
-                    time.sleep(self.message_delay)
             return response
         except Exception as e:
             logger.error(f"Erro ao enviar documento: {e}")
@@ -312,22 +365,86 @@ class BaileysAPI:
             clean_phone = self._clean_phone_number(phone)
             if not clean_phone:
                 return {'success': False, 'error': 'Número de telefone inválido'}
-            session_name = self.get_user_session(chat_id_usuario)
-            data = {
+            verificacao = self.check_numbers([clean_phone], chat_id_usuario).get(clean_phone)
+            if verificacao is None:
+                return {'success': False, 'error': 'Não foi possível verificar o número'}
+            return {
+                'success': True,
                 'number': clean_phone,
-                'session': session_name
+                'exists': verificacao['registered'],
+                'jid': verificacao['jid']
             }
-            response = self._make_request('check-number', 'POST', data)
-            return response
         except Exception as e:
             logger.error(f"Erro ao verificar número: {e}")
             return {'success': False, 'error': str(e)}
 
+    def check_numbers(self, phones, chat_id_usuario: int) -> Dict:
+        try:
+            resultado = {}
+            numeros = {}
+            for phone in set(phones):
+                clean_phone = self._clean_phone_number(phone)
+                if clean_phone:
+                    numeros.setdefault(clean_phone, []).append(phone)
+                else:
+                    resultado[phone] = {'number': '', 'registered': False, 'jid': None}
+            # Memória, depois banco, e só o que faltar vai ao servidor Node
+            conhecidos = {}
+            faltando = []
+            for numero in numeros:
+                verificacao = self._number_cache.get(numero)
+                if verificacao is not None:
+                    conhecidos[numero] = verificacao
+                else:
+                    faltando.append(numero)
+            if faltando and self.number_store is not None:
+                try:
+                    salvos = self.number_store.obter_numeros_whatsapp(faltando)
+                except Exception as e:
+                    logger.error(f"Erro ao ler números verificados: {e}")
+                    salvos = {}
+                for numero, verificacao in salvos.items():
+                    self._number_cache.put(numero, verificacao)
+                    conhecidos[numero] = verificacao
+                faltando = [numero for numero in faltando if numero not in salvos]
+            novos = []
+            session_name = self.get_user_session(chat_id_usuario)
+            for inicio in range(0, len(faltando), self.check_batch_size):
+                data = {
+                    'session_id': session_name,
+                    'numbers': faltando[inicio:inicio + self.check_batch_size]
+                }
+                response = self._make_request('check-numbers', 'POST', data, retries=0)
+                if not response.get('success'):
+                    logger.warning(f"Verificação de números falhou na sessão {session_name}: {response.get('error')}")
+                    break
+                for item in response.get('results', []):
+                    if item.get('exists') is None:
+                        continue
+                    verificacao = (bool(item['exists']), item.get('jid'))
+                    self._number_cache.put(item['number'], verificacao)
+                    conhecidos[item['number']] = verificacao
+                    novos.append((item['number'],) + verificacao)
+            if novos and self.number_store is not None:
+                try:
+                    self.number_store.salvar_numeros_whatsapp(novos)
+                except Exception as e:
+                    logger.error(f"Erro ao salvar números verificados: {e}")
+            for numero, originais in numeros.items():
+                if numero in conhecidos:
+                    registrado, jid = conhecidos[numero]
+                    for phone in originais:
+                        resultado[phone] = {'number': numero, 'registered': registrado, 'jid': jid}
+            return resultado
+        except Exception as e:
+            logger.error(f"Erro ao verificar números: {e}")
+            return {}
+
     def reconnect(self, chat_id_usuario: int) -> Dict:
         try:
             session_name = self.get_user_session(chat_id_usuario)
             response = self._make_request(f'restart/{session_name}', 'POST')
-            self._status_cache = {}
+            self._status_cache.invalidate(session_name)
             return response
         except Exception as e:
             logger.error(f"Erro ao reconectar: {e}")
@@ -337,7 +454,7 @@ class BaileysAPI:
         try:
             session_name = self.get_user_session(chat_id_usuario)
             response = self._make_request(f'logout/{session_name}', 'POST')
-            self._status_cache = {}
+            self._status_cache.invalidate(session_name)
             return response
         except Exception as e:
             logger.error(f"Erro ao fazer logout: {e}")
@@ -383,46 +500,114 @@ class BaileysAPI:
             logger.error(f"Erro ao obter histórico: {e}")
             return {'success': False, 'error': str(e)}
 
+    def schedule_send(self, chat_id_usuario: int, key, func, *args) -> bool:
+        self.send_engine.start()
+        return self.send_engine.submit(self.get_user_session(chat_id_usuario), key, func, *args)
+
     def send_bulk_messages(self, messages: List[Dict], chat_id_usuario: int) -> Dict:
         try:
+            concluido = threading.Event()
+            cancelado = threading.Event()
+            saida = {}
+
+            def enviar():
+                try:
+                    if cancelado.is_set():
+                        return False
+                    saida.update(self.send_batch(messages, chat_id_usuario))
+                    return saida.get('success', False)
+                finally:
+                    concluido.set()
+
+            # Espera limitada: envios já na fila da sessão, o próprio lote e uma margem de rede
+            intervalo = self.message_delay + self.send_engine.jitter
+            pendentes = self.send_engine.pendentes(self.get_user_session(chat_id_usuario))
+            limite = (pendentes + len(messages)) * intervalo + 2 * self.timeout
+
+            # Um único /send-batch ocupando a vez da sessão no motor: o servidor cumpre o intervalo
+            # entre as mensagens e o motor não dispara /send-message da sessão no meio do lote
+            if not self.schedule_send(chat_id_usuario, object(), enviar):
+                return {'success': False, 'error': 'Lote não agendado'}
+            if not concluido.wait(limite):
+                # Lote que ainda não começou não é mais enviado; o que já começou segue no servidor
+                cancelado.set()
+                logger.error(f"Envio em lote sem resposta após {limite:.0f}s")
+                return {'success': False, 'error': f'Tempo esgotado aguardando o lote ({limite:.0f}s)'}
+            if saida.get('success'):
+                saida['error_count'] = saida['total'] - saida['success_count']
+            return saida
+        except Exception as e:
+            logger.error(f"Erro no envio em lote: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def send_batch(self, messages: List[Dict], chat_id_usuario: int, on_result=None) -> Dict:
+        try:
+            session_name = self.get_user_session(chat_id_usuario)
             results = []
-            success_count = 0
-            error_count = 0
+            itens = []
             for i, msg_data in enumerate(messages):
-                phone = msg_data.get('phone')
-                message = msg_data.get('message')
-                if not phone or not message:
-                    results.append({
+                clean_phone = self._clean_phone_number(msg_data.get('phone'))
+                if not clean_phone or not msg_data.get('message'):
+                    result = {
                         'index': i,
-                        'phone': phone,
+                        'id': msg_data.get('id'),
+                        'phone': msg_data.get('phone'),
                         'success': False,
-                        'error': 'Dados incompletos'
-                    })
-                    error_count += 1
+                        'error': 'Número de telefone inválido' if msg_data.get('message') else 'Dados incompletos'
+                    }
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
                     continue
-                result = self.send_message(phone, message, chat_id_usuario)
-                results.append({
-                    'index': i,
-                    'phone': phone,
-                    'success': result['success'],
-                    'message_id': result.get('message_id'),
-                    'error': result.get('error')
-                })
-                if result['success']:
-                    success_count += 1
-                else:
-                    error_count += 1
-                if i < len(messages) - 1 and self.message_delay > 0:
-                    time.sleep(self.message_delay)
+                itens.append((i, msg_data, clean_phone))
+            if itens:
+                data = {
+                    'session_id': session_name,
+                    'delay_ms': int(self.message_delay * 1000),
+                    'messages': [{'id': j, 'number': clean_phone, 'message': msg_data['message']}
+                                 for j, (_, msg_data, clean_phone) in enumerate(itens)]
+                }
+                # O servidor aguarda o intervalo entre mensagens antes de escrever a próxima linha
+                response = self.session.post(f"{self.base_url}/send-batch", json=data, stream=True,
+                                             timeout=(self.timeout, self.timeout + self.message_delay))
+                with response:
+                    if response.status_code != 200:
+                        try:
+                            error_msg = response.json().get('error')
+                        except ValueError:
+                            error_msg = None
+                        return {'success': False, 'error': error_msg or f'API retornou status {response.status_code}'}
+                    for linha in response.iter_lines():
+                        if not linha:
+                            continue
+                        item = json.loads(linha)
+                        if item.get('done'):
+                            if item.get('error'):
+                                logger.error(f"Erro no lote da sessão {session_name}: {item['error']}")
+                            continue
+                        i, msg_data, _ = itens[item['id']]
+                        result = {
+                            'index': i,
+                            'id': msg_data.get('id'),
+                            'phone': msg_data.get('phone'),
+                            'success': item.get('success', False),
+                            'message_id': item.get('messageId'),
+                            'error': item.get('error')
+                        }
+                        results.append(result)
+                        if on_result:
+                            on_result(result)
+            success_count = sum(1 for result in results if result['success'])
             return {
                 'success': True,
                 'total': len(messages),
+                'processed': len(results),
                 'success_count': success_count,
-                'error_count': error_count,
-                'results': results
+                'error_count': len(results) - success_count,
+                'results': sorted(results, key=lambda result: result['index'])
             }
         except Exception as e:
-            logger.error(f"Erro no envio em lote: {e}")
+            logger.error(f"Erro no envio em lote (send-batch): {e}")
             return {'success': False, 'error': str(e)}
 
     def health_check(self) -> Dict:
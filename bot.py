@@ -11,6 +11,7 @@ from flask import Flask, request, jsonify
 import asyncio
 import threading
 import time
+import traceback
 from datetime import datetime, timedelta
 import pytz
 from database import DatabaseManager
@@ -19,9 +20,12 @@ from baileys_api import BaileysAPI
 from scheduler_v2_simple import SimpleScheduler
 # from baileys_clear import BaileysCleaner  # Removido - não utilizado
 from schedule_config import ScheduleConfig
-from whatsapp_session_api import session_api, init_session_manager
+from whatsapp_session_api import session_api, init_session_manager, register_status_listener
 from user_management import UserManager
 from mercadopago_integration import MercadoPagoIntegration
+from telegram_client import get_telegram_client
+from update_dispatcher import UpdateDispatcher
+from callback_router import CallbackRouter, CallbackContext, CallbackArgumentError
 
 # Configuração de logging otimizada para performance
 logging.basicConfig(
@@ -44,6 +48,23 @@ app = Flask(__name__)
 # Configurações do bot
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
+
+# Long polling do Telegram (limites da Bot API: timeout até 50s, até 100 updates por chamada)
+TELEGRAM_POLL_TIMEOUT = min(max(int(os.getenv('TELEGRAM_POLL_TIMEOUT', '50')), 0), 50)
+TELEGRAM_POLL_LIMIT = min(max(int(os.getenv('TELEGRAM_POLL_LIMIT', '100')), 1), 100)
+_ultimo_update_id = 0
+_offset_carregado = False
+_polling_lock = threading.Lock()
+
+# Updates entregues ao despachante e ainda não concluídos (o offset confirmado é a marca d'água)
+_maior_despachado = 0
+_em_andamento = set()
+_offset_lock = threading.Lock()
+
+# Tempo que o webhook espera por espaço na fila antes de responder 503
+BOT_QUEUE_TIMEOUT = float(os.getenv('BOT_QUEUE_TIMEOUT', '5'))
+
+update_dispatcher = None
 TIMEZONE_BR = pytz.timezone('America/Sao_Paulo')
 
 # Estados da conversação
@@ -60,7 +81,8 @@ class TelegramBot:
     
     def __init__(self, token):
         self.token = token
-        self.base_url = f"https://api.telegram.org/bot{token}"
+        self.telegram = get_telegram_client(token)
+        self.base_url = self.telegram.base_url
         
         # Instâncias dos serviços
         self.db = None
@@ -78,11 +100,11 @@ class TelegramBot:
         self.user_states = {}  # Para gerenciar estados de criação de templates
         self._last_payment_request = {}  # Rate limiting para pagamentos
         self._payment_requested = set()  # Track payment requests
+        self._usuarios_provisionados = set()  # Usuários com configurações padrão já garantidas
     
     def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
         """Envia mensagem via API HTTP"""
         try:
-            url = f"{self.base_url}/sendMessage"
             data = {
                 'chat_id': chat_id,
                 'text': text
@@ -96,7 +118,7 @@ class TelegramBot:
             logger.debug(f"Data: {data}")
             
             # Usar form data ao invés de JSON para compatibilidade com Telegram API
-            response = requests.post(url, data=data, timeout=10)
+            response = self.telegram.send_message(data, timeout=10)
             
             # Log da resposta para debug
             logger.debug(f"Response status: {response.status_code}")
@@ -107,8 +129,6 @@ class TelegramBot:
             return response.json()
         except Exception as e:
             logger.error(f"Erro ao enviar mensagem: {e}")
-            if 'url' in locals():
-                logger.error(f"URL: {url}")
             if 'data' in locals():
                 logger.error(f"Data: {data}")
             return None
@@ -191,7 +211,9 @@ class TelegramBot:
         
         try:
             # Inicializar Baileys API
-            self.baileys_api = BaileysAPI()
+            self.baileys_api = BaileysAPI(number_store=self.db)
+            # Status das sessões chega por push do servidor Baileys
+            register_status_listener(self.baileys_api.apply_status_event)
             logger.info("✅ Baileys API inicializada")
         except Exception as e:
             logger.error(f"Erro Baileys API: {e}")
@@ -241,38 +263,25 @@ class TelegramBot:
         try:
             if self.is_admin(chat_id):
                 return True
-                
-            # Verificar se usuário existe e tem configurações
-            conn = self.db.get_connection()
-            with conn.cursor() as cursor:
-                # Verificar configurações do usuário
-                cursor.execute("""
-                    SELECT COUNT(*) FROM configuracoes 
-                    WHERE chat_id_usuario = %s
-                """, (chat_id,))
-                
-                configs_count = cursor.fetchone()[0]
-                
-                if configs_count == 0:
-                    # Criar configurações padrão para o usuário
-                    configs_default = [
-                        ('empresa_nome', 'Minha Empresa', 'Nome da empresa'),
-                        ('empresa_pix', '', 'Chave PIX para pagamentos'),
-                        ('empresa_telefone', '', 'Telefone de contato'),
-                        ('empresa_titular', '', 'Nome do titular PIX')
-                    ]
-                    
-                    for chave, valor, desc in configs_default:
-                        cursor.execute("""
-                            INSERT INTO configuracoes (chave, valor, descricao, chat_id_usuario)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (chave, chat_id_usuario) DO NOTHING
-                        """, (chave, valor, desc, chat_id))
-                    
-                    logger.info(f"✅ Configurações criadas para usuário {chat_id}")
             
-            conn.commit()
-            conn.close()
+            # Já verificado neste processo: nenhuma consulta
+            if chat_id in self._usuarios_provisionados:
+                return True
+            
+            # O marcador vem junto com as configurações do usuário (cache), então
+            # usuários já provisionados em execuções anteriores também não pagam consulta extra
+            if not self.db.usuario_provisionado(chat_id):
+                # Criar configurações padrão para o usuário
+                configs_default = [
+                    ('empresa_nome', 'Minha Empresa', 'Nome da empresa'),
+                    ('empresa_pix', '', 'Chave PIX para pagamentos'),
+                    ('empresa_telefone', '', 'Telefone de contato'),
+                    ('empresa_titular', '', 'Nome do titular PIX')
+                ]
+                self.db.provisionar_usuario(chat_id, configs_default)
+                logger.info(f"✅ Configurações criadas para usuário {chat_id}")
+            
+            self._usuarios_provisionados.add(chat_id)
             return True
             
         except Exception as e:
@@ -1834,13 +1843,12 @@ Após o período de teste, continue usando por apenas R$ 20,00/mês!"""
     def handle_callback_query(self, callback_query):
         """Processa callback queries dos botões inline"""
         try:
-            chat_id = callback_query['message']['chat']['id']
-            callback_data = callback_query['data']
-            message_id = callback_query['message']['message_id']
-            callback_query_id = callback_query['id']
+            ctx = CallbackContext(self, callback_query)
+            chat_id = ctx.chat_id
+            callback_data = ctx.data
             
             # Responder ao callback para remover o "loading"
-            self.answer_callback_query(callback_query_id)
+            self.answer_callback_query(ctx.callback_query_id)
             
             # Verificar acesso (admin ou usuário com acesso)
             if not self.is_admin(chat_id):
@@ -1854,698 +1862,15 @@ Após o período de teste, continue usando por apenas R$ 20,00/mês!"""
                 else:
                     return
             
-            # Processar diferentes tipos de callback
-            if callback_data.startswith('cliente_detalhes_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.mostrar_detalhes_cliente(chat_id, cliente_id, message_id)
-            
-            elif callback_data.startswith('cliente_editar_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.editar_cliente(chat_id, cliente_id)
-            
-            elif callback_data.startswith('edit_') and not callback_data.startswith('edit_template_') and not callback_data.startswith('edit_config_') and not callback_data.startswith('edit_horario_'):
-                campo = callback_data.split('_')[1]
-                cliente_id = int(callback_data.split('_')[2])
-                self.iniciar_edicao_campo(chat_id, cliente_id, campo)
-            
-            elif callback_data.startswith('cliente_renovar_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.renovar_cliente(chat_id, cliente_id)
-            
-            elif callback_data.startswith('renovar_30dias_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.processar_renovacao_30dias(chat_id, cliente_id)
-            
-            elif callback_data.startswith('renovar_proximo_mes_'):
-                cliente_id = int(callback_data.split('_')[3])
-                self.processar_renovacao_proximo_mes(chat_id, cliente_id)
-            
-            elif callback_data.startswith('renovar_nova_data_'):
-                cliente_id = int(callback_data.split('_')[3])
-                self.iniciar_renovacao_nova_data(chat_id, cliente_id)
-            
-            elif callback_data.startswith('cliente_mensagem_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.enviar_mensagem_cliente(chat_id, cliente_id)
-            
-            elif callback_data.startswith('enviar_renovacao_'):
-                partes = callback_data.split('_')
-                cliente_id = int(partes[2])
-                template_id = int(partes[3])
-                self.enviar_mensagem_renovacao(chat_id, cliente_id, template_id)
-            
-            elif callback_data.startswith('enviar_mensagem_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.enviar_mensagem_cliente(chat_id, cliente_id)
-            
-            elif callback_data.startswith('cliente_excluir_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.confirmar_exclusao_cliente(chat_id, cliente_id, message_id)
-            
-            elif callback_data.startswith('cliente_notificacoes_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.configurar_notificacoes_cliente(chat_id, cliente_id, message_id)
-            
-            elif callback_data.startswith('toggle_cobranca_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.toggle_notificacao_cobranca(chat_id, cliente_id, message_id)
-                
-            elif callback_data.startswith('toggle_notificacoes_'):
-                cliente_id = int(callback_data.split('_')[2])
-                self.toggle_notificacao_geral(chat_id, cliente_id, message_id)
-            
-            elif callback_data.startswith('confirmar_excluir_cliente_'):
-                cliente_id = int(callback_data.split('_')[3])
-                self.excluir_cliente(chat_id, cliente_id, message_id)
-            
-            # Callbacks de cópia removidos - informações agora copiáveis diretamente
-            
-            elif callback_data == 'menu_clientes':
-                self.gestao_clientes_menu(chat_id)
-            
-            elif callback_data == 'voltar_lista':
-                self.listar_clientes(chat_id)
-            
-            elif callback_data == 'voltar_clientes':
-                self.gestao_clientes_menu(chat_id)
-            
-            elif callback_data == 'nova_busca':
-                self.iniciar_busca_cliente(chat_id)
-            
-            elif callback_data == 'listar_vencimentos':
-                self.listar_vencimentos(chat_id)
-            
-            elif callback_data == 'menu_principal':
-                self.start_command(chat_id)
-            
-            elif callback_data == 'cadastrar_outro_cliente':
-                self.iniciar_cadastro_cliente(chat_id)
-            
-            elif callback_data == 'voltar_menu_principal':
-                self.start_command(chat_id)
-            
-            elif callback_data.startswith('template_detalhes_'):
-                template_id = int(callback_data.split('_')[2])
-                logger.info(f"Callback recebido para template detalhes: {template_id}")
-                logger.info(f"Chamando mostrar_detalhes_template com chat_id={chat_id}, template_id={template_id}, message_id={message_id}")
-                self.mostrar_detalhes_template(chat_id, template_id, message_id)
-                logger.info(f"mostrar_detalhes_template executado")
-            
-            elif callback_data.startswith('template_editar_'):
-                template_id = int(callback_data.split('_')[2])
-                logger.info(f"Callback editar template recebido: template_id={template_id}")
-                self.editar_template(chat_id, template_id)
-            
-            elif callback_data.startswith('template_excluir_'):
-                template_id = int(callback_data.split('_')[2])
-                self.confirmar_exclusao_template(chat_id, template_id, message_id)
-            
-            elif callback_data.startswith('confirmar_excluir_template_'):
-                try:
-                    # CORREÇÃO: Pegar o último elemento após split para obter o template_id
-                    logger.info(f"DEBUG: Processando exclusão - callback_data: {callback_data}")
-                    parts = callback_data.split('_')
-                    logger.info(f"DEBUG: Split parts: {parts}")
-                    template_id_str = parts[-1]
-                    logger.info(f"DEBUG: Template ID string: '{template_id_str}'")
-                    template_id = int(template_id_str)
-                    logger.info(f"DEBUG: Template ID convertido: {template_id}")
-                    self.excluir_template(chat_id, template_id, message_id)
-                except Exception as e:
-                    logger.error(f"Erro ao processar exclusão de template: {e}")
-                    logger.error(f"Callback data: {callback_data}")
-                    self.send_message(chat_id, f"❌ Erro ao processar exclusão: {str(e)}")
-            
-            elif callback_data.startswith('template_enviar_'):
-                template_id = int(callback_data.split('_')[2])
-                self.selecionar_cliente_template(chat_id, template_id)
-            
-            elif callback_data == 'template_criar':
-                self.criar_template(chat_id)
-            
-            # Callbacks para cópia de tags de template
-            elif callback_data.startswith('copy_tag_'):
-                tag_nome = callback_data.replace('copy_tag_', '')
-                self.copiar_tag_template(chat_id, tag_nome)
-            
-            elif callback_data == 'template_content_done':
-                self.finalizar_conteudo_template(chat_id)
-            
-            elif callback_data == 'template_stats':
-                self.mostrar_stats_templates(chat_id)
-            
-            elif callback_data == 'voltar_templates':
-                self.templates_menu(chat_id)
-            
-            elif callback_data == 'voltar_configs':
-                self.configuracoes_menu(chat_id)
-            
-            # Remover handler antigo que causa conflito
-            # elif callback_data.startswith('edit_horario_'):
-            #     campo = callback_data.split('_')[2]
-            #     self.editar_horario(chat_id, campo)
-            
-            elif callback_data == 'recriar_jobs':
-                self.schedule_config.recriar_jobs(chat_id)
-            
-            elif callback_data == 'limpar_duplicatas':
-                self.schedule_config.limpar_duplicatas(chat_id)
-            
-            elif callback_data == 'status_jobs':
-                self.schedule_config.status_jobs(chat_id)
-            
-            elif callback_data == 'reset_horarios_padrao':
-                self.schedule_config.resetar_horarios_padrao(chat_id)
-            
-            # Callbacks de configuração
-            elif callback_data == 'config_empresa':
-                self.config_empresa(chat_id)
-            
-            elif callback_data == 'config_pix':
-                self.config_pix(chat_id)
-            
-            elif callback_data == 'config_horarios':
-                self.config_horarios(chat_id)
-            
-            elif callback_data == 'edit_horario_envio':
-                self.schedule_config.edit_horario_envio(chat_id)
-            
-            elif callback_data == 'edit_horario_verificacao':
-                self.schedule_config.edit_horario_verificacao(chat_id)
-            
-            elif callback_data == 'edit_horario_limpeza':
-                self.schedule_config.edit_horario_limpeza(chat_id)
-                
-            elif callback_data.startswith('set_envio_'):
-                horario = callback_data.replace('set_envio_', '')
-                self.schedule_config.set_horario_envio(chat_id, horario)
-            
-            # Handlers do Guia do Usuário
-            elif callback_data == 'guia_usuario':
-                self.mostrar_guia_usuario(chat_id)
-            elif callback_data == 'guia_primeiros_passos':
-                self.mostrar_guia_primeiros_passos(chat_id)
-            elif callback_data == 'guia_whatsapp':
-                self.mostrar_guia_whatsapp(chat_id)
-            elif callback_data == 'guia_clientes':
-                self.mostrar_guia_clientes(chat_id)
-            elif callback_data == 'guia_templates':
-                self.mostrar_guia_templates(chat_id)
-            elif callback_data == 'guia_envios':
-                self.mostrar_guia_envios(chat_id)
-            elif callback_data == 'guia_automacao':
-                self.mostrar_guia_automacao(chat_id)
-            elif callback_data == 'guia_relatorios':
-                self.mostrar_guia_relatorios(chat_id)
-            elif callback_data == 'guia_problemas':
-                self.mostrar_guia_problemas(chat_id)
-            elif callback_data == 'guia_dicas':
-                self.mostrar_guia_dicas(chat_id)
-            
-            # Handlers para templates modelo
-            elif callback_data.startswith('usar_modelo_'):
-                tipo = callback_data.replace('usar_modelo_', '')
-                self.usar_template_modelo(chat_id, tipo)
-            elif callback_data.startswith('editar_modelo_'):
-                tipo = callback_data.replace('editar_modelo_', '')
-                self.editar_template_modelo(chat_id, tipo)
-            elif callback_data == 'criar_do_zero':
-                self.criar_template_do_zero(chat_id)
-            elif callback_data == 'voltar_tipo_template':
-                self.voltar_selecao_tipo_template(chat_id)
-            elif callback_data == 'confirmar_template':
-                self.confirmar_criacao_template(chat_id)
-            elif callback_data == 'editar_conteudo_template':
-                self.editar_conteudo_template(chat_id)
-                
-            elif callback_data.startswith('set_verificacao_'):
-                horario = callback_data.replace('set_verificacao_', '')
-                self.schedule_config.set_horario_verificacao(chat_id, horario)
-                
-            elif callback_data.startswith('set_limpeza_'):
-                horario = callback_data.replace('set_limpeza_', '')
-                self.schedule_config.set_horario_limpeza(chat_id, horario)
-                
-            elif callback_data == 'horario_personalizado_envio':
-                self.schedule_config.horario_personalizado_envio(chat_id)
-                
-            elif callback_data == 'horario_personalizado_verificacao':
-                self.schedule_config.horario_personalizado_verificacao(chat_id)
-                
-            elif callback_data == 'horario_personalizado_limpeza':
-                self.schedule_config.horario_personalizado_limpeza(chat_id)
-            
-            elif callback_data == 'config_baileys_status':
-                self.config_baileys_status(chat_id)
-            
-            # Casos específicos de PIX primeiro
-            elif callback_data == 'edit_config_pix_chave':
-                self.iniciar_edicao_config(chat_id, 'empresa_pix', 'Chave PIX')
-                
-            elif callback_data == 'edit_config_pix_titular':
-                self.iniciar_edicao_config(chat_id, 'empresa_titular', 'Titular da Conta')
-            
-            elif callback_data.startswith('edit_config_'):
-                try:
-                    partes = callback_data.split('_')
-                    if len(partes) >= 4:
-                        config_type = partes[2]
-                        config_field = partes[3]
-                        config_key = f"{config_type}_{config_field}"
-                        config_name = f"{config_type.title()} {config_field.title()}"
-                        self.iniciar_edicao_config(chat_id, config_key, config_name)
-                except Exception as e:
-                    logger.error(f"Erro ao processar edição de config: {e}")
-                    self.send_message(chat_id, "❌ Erro ao iniciar edição.")
-            
-            elif callback_data == 'baileys_check_status':
-                self.config_baileys_status(chat_id)
-            
-            # Callbacks do menu Baileys
-            elif callback_data == 'baileys_menu':
-                self.baileys_menu(chat_id)
-            
-            elif callback_data == 'baileys_qr_code':
-                self.gerar_qr_whatsapp(chat_id)
-            
-
-            
-            elif callback_data == 'baileys_pairing_code':
-                self.solicitar_numero_telefone_pareamento(chat_id)
-            
-            elif callback_data == 'baileys_status':
-                self.verificar_status_baileys(chat_id)
-            
-            elif callback_data == 'baileys_test':
-                self.testar_envio_whatsapp(chat_id)
-            
-            elif callback_data == 'baileys_logs':
-                self.mostrar_logs_baileys(chat_id)
-            
-            elif callback_data == 'baileys_stats':
-                self.mostrar_stats_baileys(chat_id)
-            
-            # Callbacks para edição de templates
-            elif callback_data.startswith('edit_template_'):
-                try:
-                    partes = callback_data.split('_')
-                    campo = partes[2]
-                    template_id = int(partes[3])
-                    logger.info(f"Processando edição: campo={campo}, template_id={template_id}")
-                    self.iniciar_edicao_template_campo(chat_id, template_id, campo)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao processar callback de edição: {e}")
-                    self.send_message(chat_id, "❌ Erro ao processar edição.")
-            
-            # Callbacks para definir tipo de template
-            elif callback_data.startswith('set_template_tipo_'):
-                try:
-                    partes = callback_data.split('_')
-                    template_id = int(partes[3])
-                    tipo = partes[4]
-                    logger.info(f"Atualizando tipo: template_id={template_id}, tipo={tipo}")
-                    self.atualizar_template_tipo(chat_id, template_id, tipo)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao atualizar tipo: {e}")
-                    self.send_message(chat_id, "❌ Erro ao atualizar tipo.")
-                
-            # Callbacks para definir status de template
-            elif callback_data.startswith('set_template_status_'):
-                try:
-                    partes = callback_data.split('_')
-                    template_id = int(partes[3])
-                    status = partes[4] == 'True'
-                    logger.info(f"Atualizando status: template_id={template_id}, status={status}")
-                    self.atualizar_template_status(chat_id, template_id, status)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao atualizar status: {e}")
-                    self.send_message(chat_id, "❌ Erro ao atualizar status.")
-            
-            # Callbacks para envio de mensagens
-            elif callback_data.startswith('enviar_mensagem_'):
-                try:
-                    cliente_id = int(callback_data.split('_')[2])
-                    self.enviar_mensagem_cliente(chat_id, cliente_id)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao processar envio mensagem: {e}")
-                    self.send_message(chat_id, "❌ Erro ao carregar mensagens.")
-            
-            elif callback_data.startswith('enviar_template_'):
-                try:
-                    logger.info(f"Processando callback enviar_template: {callback_data}")
-                    partes = callback_data.split('_')
-                    logger.info(f"Partes do callback: {partes}")
-                    
-                    if len(partes) >= 4:
-                        cliente_id = int(partes[2])
-                        template_id = int(partes[3])
-                        logger.info(f"Extraindo IDs: cliente_id={cliente_id}, template_id={template_id}")
-                        self.enviar_template_para_cliente(chat_id, cliente_id, template_id)
-                    else:
-                        logger.error(f"Formato de callback inválido: {callback_data} - partes: {len(partes)}")
-                        self.send_message(chat_id, "❌ Formato de callback inválido.")
-                        
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao processar template: {e}")
-                    self.send_message(chat_id, "❌ Erro ao processar template.")
-                except Exception as e:
-                    logger.error(f"Erro inesperado no callback enviar_template: {e}")
-                    self.send_message(chat_id, "❌ Erro inesperado.")
-            
-            elif callback_data.startswith('confirmar_envio_'):
-                try:
-                    logger.info(f"[RAILWAY] Processando callback confirmar_envio: {callback_data}")
-                    partes = callback_data.split('_')
-                    logger.info(f"[RAILWAY] Partes do callback: {partes}")
-                    
-                    if len(partes) >= 4:
-                        cliente_id = int(partes[2])
-                        template_id = int(partes[3])
-                        logger.info(f"[RAILWAY] Extraindo IDs: cliente_id={cliente_id}, template_id={template_id}")
-                        # Corrigido: Usar método da instância ao invés de função global
-                        self.confirmar_envio_mensagem(chat_id, cliente_id, template_id)
-                    else:
-                        logger.error(f"[RAILWAY] Formato de callback inválido: {callback_data} - partes: {len(partes)}")
-                        self.send_message(chat_id, "❌ Formato de callback inválido.")
-                        
-                except (IndexError, ValueError) as e:
-                    logger.error(f"[RAILWAY] Erro ao confirmar envio: {e}")
-                    self.send_message(chat_id, "❌ Erro ao enviar mensagem.")
-                except Exception as e:
-                    logger.error(f"Erro inesperado no callback confirmar_envio: {e}")
-                    self.send_message(chat_id, "❌ Erro inesperado.")
-            
-            elif callback_data.startswith('mensagem_custom_'):
-                try:
-                    cliente_id = int(callback_data.split('_')[2])
-                    iniciar_mensagem_personalizada_global(chat_id, cliente_id)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao iniciar mensagem custom: {e}")
-                    self.send_message(chat_id, "❌ Erro ao inicializar mensagem personalizada.")
-            
-            # Handlers do Agendador
-            elif callback_data == 'agendador_status':
-                self.mostrar_status_agendador(chat_id)
-            
-            elif callback_data == 'agendador_stats':
-                self.mostrar_estatisticas_agendador(chat_id)
-            
-            elif callback_data == 'agendador_processar':
-                self.processar_vencimentos_manual(chat_id)
-            
-            elif callback_data == 'agendador_logs':
-                self.mostrar_logs_agendador(chat_id)
-            
-            elif callback_data == 'agendador_menu':
-                self.agendador_menu(chat_id)
-            
-            # Callbacks CRÍTICOS que estavam faltando - SISTEMA MULTI-USER
-            elif callback_data == 'adicionar_cliente':
-                self.iniciar_cadastro_cliente(chat_id)
-            
-            elif callback_data == 'whatsapp_setup':
-                self.whatsapp_menu(chat_id)
-            
-            elif callback_data == 'relatorios_usuario':
-                self.relatorios_usuario(chat_id)
-            
-            elif callback_data.startswith('gerar_pix_'):
-                user_chat_id = int(callback_data.replace('gerar_pix_', ''))
-                self.gerar_pix_pagamento(user_chat_id, callback_query['id'])
-            
-            elif callback_data.startswith('verificar_pix_'):
-                payment_id = callback_data.replace('verificar_pix_', '')
-                self.verificar_pix_pagamento(chat_id, payment_id)
-            
-            elif callback_data.startswith('verificar_pagamento_'):
-                payment_id = callback_data.replace('verificar_pagamento_', '')
-                self.verificar_pagamento_manual(chat_id, payment_id)
-            
-            elif callback_data == 'cancelar':
-                self.cancelar_operacao(chat_id)
-            
-            elif callback_data == 'listar_clientes':
-                self.listar_clientes(chat_id)
-            
-            elif callback_data == 'listar_clientes_usuario':
-                self.listar_clientes_usuario(chat_id)
-            
-            elif callback_data == 'relatorio_mensal':
-                self.relatorio_mensal_detalhado(chat_id)
-            
-            elif callback_data == 'evolucao_grafica':
-                self.evolucao_grafica(chat_id)
-            
-            elif callback_data == 'templates_menu':
-                self.templates_menu(chat_id)
-            
-            elif callback_data == 'config_notificacoes':
-                self.config_notificacoes(chat_id)
-            
-            elif callback_data == 'config_sistema':
-                self.config_sistema(chat_id)
-            
-            elif callback_data == 'whatsapp_menu':
-                self.whatsapp_menu(chat_id)
-            
-            elif callback_data == 'agendador_fila':
-                self.mostrar_fila_mensagens(chat_id)
-            
-            elif callback_data.startswith('cancelar_msg_'):
-                try:
-                    msg_id = int(callback_data.split('_')[2])
-                    self.cancelar_mensagem_agendada(chat_id, msg_id)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao cancelar mensagem: {e}")
-                    self.send_message(chat_id, "❌ Erro ao cancelar mensagem.")
-            
-            elif callback_data.startswith('fila_cliente_'):
-                try:
-                    partes = callback_data.split('_')
-                    if len(partes) >= 4:
-                        msg_id = int(partes[2])
-                        cliente_id = int(partes[3])
-                        self.mostrar_opcoes_cliente_fila(chat_id, msg_id, cliente_id)
-                    else:
-                        self.send_message(chat_id, "❌ Erro ao processar cliente.")
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao mostrar opções do cliente: {e}")
-                    self.send_message(chat_id, "❌ Erro ao carregar opções do cliente.")
-            
-            elif callback_data.startswith('enviar_agora_'):
-                try:
-                    msg_id = int(callback_data.split('_')[2])
-                    self.enviar_mensagem_agora(chat_id, msg_id)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao enviar mensagem agora: {e}")
-                    self.send_message(chat_id, "❌ Erro ao enviar mensagem.")
-            
-            elif callback_data.startswith('enviar_agora_cliente_'):
-                try:
-                    cliente_id = int(callback_data.split('_')[3])
-                    self.enviar_todas_mensagens_cliente_agora(chat_id, cliente_id)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao enviar mensagens do cliente: {e}")
-                    self.send_message(chat_id, "❌ Erro ao enviar mensagens do cliente.")
-            
-            elif callback_data.startswith('cancelar_cliente_'):
-                try:
-                    cliente_id = int(callback_data.split('_')[2])
-                    self.cancelar_todas_mensagens_cliente(chat_id, cliente_id)
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Erro ao cancelar mensagens do cliente: {e}")
-                    self.send_message(chat_id, "❌ Erro ao cancelar mensagens do cliente.")
-            
-            elif callback_data == 'atualizar_fila':
-                self.mostrar_fila_mensagens(chat_id)
-            
-            elif callback_data == 'cancelar':
-                self.cancelar_operacao(chat_id)
-            
-            # ===== CALLBACKS ADMINISTRATIVOS FALTANTES =====
-            # Callbacks de gestão de usuários (admin)
-            elif callback_data == 'gestao_usuarios':
-                self.gestao_usuarios_menu(chat_id)
-            
-            elif callback_data == 'listar_usuarios':
-                self.listar_todos_usuarios_admin(chat_id)
-            
-            elif callback_data == 'cadastrar_usuario':
-                self.iniciar_cadastro_usuario_admin(chat_id)
-            
-            elif callback_data == 'buscar_usuario':
-                self.buscar_usuario_admin(chat_id)
-            
-            elif callback_data == 'estatisticas_usuarios':
-                self.estatisticas_usuarios_admin(chat_id)
-            
-            elif callback_data == 'usuarios_vencendo':
-                self.listar_usuarios_vencendo_admin(chat_id)
-            
-            elif callback_data == 'pagamentos_pendentes':
-                self.listar_pagamentos_pendentes_admin(chat_id)
-            
-            elif callback_data == 'enviar_cobranca_geral':
-                self.enviar_cobranca_geral_admin(chat_id)
-            
-            # Callbacks para geração de PIX automático
-            elif callback_data.startswith('gerar_pix_usuario_'):
-                user_id = callback_data.replace('gerar_pix_usuario_', '')
-                self.processar_gerar_pix_usuario(chat_id, user_id)
-            
-            elif callback_data.startswith('gerar_pix_renovacao_'):
-                user_id = callback_data.replace('gerar_pix_renovacao_', '')
-                self.processar_gerar_pix_renovacao(chat_id, user_id)
-            
-            # Callbacks de faturamento
-            elif callback_data == 'faturamento_menu':
-                self.faturamento_menu(chat_id)
-            
-            elif callback_data == 'faturamento_detalhado':
-                self.faturamento_detalhado_admin(chat_id)
-            
-            elif callback_data == 'relatorio_usuarios':
-                self.gerar_relatorio_mensal_admin(chat_id)
-            
-            # Callbacks de relatórios
-            elif callback_data == 'relatorio_periodo':
-                self.relatorio_por_periodo(chat_id)
-            
-            elif callback_data == 'relatorio_comparativo':
-                self.relatorio_comparativo_mensal(chat_id)
-            
-            elif callback_data == 'relatorios_menu':
-                self.mostrar_relatorios(chat_id)
-            
-            elif callback_data.startswith('periodo_'):
-                dias_map = {
-                    'periodo_7_dias': 7,
-                    'periodo_30_dias': 30,
-                    'periodo_3_meses': 90,
-                    'periodo_6_meses': 180
-                }
-                dias = dias_map.get(callback_data, 30)
-                self.gerar_relatorio_periodo(chat_id, dias)
-            
-            elif callback_data == 'relatorio_financeiro':
-                self.relatorio_financeiro(chat_id)
-            
-            elif callback_data == 'relatorio_sistema':
-                self.relatorio_sistema(chat_id)
-                
-            elif callback_data == 'relatorio_completo':
-                self.relatorio_completo(chat_id)
-            
-            elif callback_data == 'financeiro_detalhado':
-                self.financeiro_detalhado(chat_id)
-            
-            elif callback_data == 'financeiro_projecoes':
-                self.financeiro_projecoes(chat_id)
-            
-            elif callback_data == 'dashboard_executivo':
-                self.dashboard_executivo(chat_id)
-            
-            elif callback_data == 'projecoes_futuras':
-                self.projecoes_futuras(chat_id)
-            
-            elif callback_data == 'plano_acao':
-                self.plano_acao(chat_id)
-            
-            elif callback_data == 'relatorio_mensal_detalhado':
-                self.relatorio_mensal_detalhado(chat_id)
-            
-            elif callback_data == 'evolucao_grafica':
-                self.evolucao_grafica(chat_id)
-            
-            elif callback_data.startswith('gerar_pix_DUPLICADO_REMOVIDO'):
-                # REMOVIDO - duplicado implementado acima
-                pass
-            
-            elif callback_data == 'whatsapp_setup_DUPLICADO_REMOVIDO':
-                # REMOVIDO - duplicado implementado acima
-                pass
-            
-            elif callback_data == 'alterar_dados':
-                # Alterar dados do usuário
-                self.alterar_dados_usuario(chat_id)
-                if callback_query_id:
-                    self.answer_callback_query(callback_query_id, "📧 Alterando dados")
-            
-            elif callback_data in ['alterar_nome', 'alterar_email', 'alterar_telefone', 'alterar_todos']:
-                # Processar alteração específica
-                self.processar_alteracao_dados(chat_id, callback_data)
-                if callback_query_id:
-                    self.answer_callback_query(callback_query_id, "✏️ Alterando...")
-            
-            elif callback_data == 'minha_conta':
-                # Voltar para minha conta
-                self.minha_conta_menu(chat_id)
-                if callback_query_id:
-                    self.answer_callback_query(callback_query_id, "💳 Minha Conta")
-            
-            elif callback_data == 'historico_pagamentos':
-                # Mostrar histórico de pagamentos
-                self.historico_pagamentos(chat_id)
-                if callback_query_id:
-                    self.answer_callback_query(callback_query_id, "📊 Histórico")
-            
-            elif callback_data == 'menu_principal':
-                # Voltar ao menu principal
-                self.start_command(chat_id)
-                self.answer_callback_query(callback_query_id, "🏠 Menu Principal")
-            
-            # Callbacks de pagamento para usuários
-            elif callback_data.startswith('verificar_pagamento_'):
-                payment_id = callback_data.split('_')[2]
-                self.verificar_pagamento(chat_id, payment_id)
-            
-            # ===== HANDLERS FALTANTES CORRIGIDOS =====
-            elif callback_data == 'contatar_suporte':
-                self.contatar_suporte(chat_id)
-            
-            elif callback_data == 'configuracoes_menu':
-                self.configuracoes_menu(chat_id)
-            
-            elif callback_data == 'cadastrar_outro_cliente':
-                self.iniciar_cadastro_cliente(chat_id)
-            
-            elif callback_data == 'voltar_menu_principal':
-                self.start_command(chat_id)
-            
-            elif callback_data == 'sistema_verificar':
-                self.sistema_verificar_apis(chat_id)
-            
-            elif callback_data == 'sistema_logs':
-                self.sistema_mostrar_logs(chat_id)
-            
-            elif callback_data == 'sistema_status':
-                self.sistema_mostrar_status(chat_id)
-            
-            elif callback_data == 'sistema_restart':
-                self.sistema_reiniciar(chat_id)
-            
-            elif callback_data == 'confirmar_restart':
-                self.executar_restart(chat_id)
-            
-            elif callback_data.startswith('toggle_notif_'):
-                status_atual = callback_data.split('_')[2]
-                self.toggle_notificacoes_sistema(chat_id, status_atual)
-            
-            elif callback_data == 'ajuda_pagamento':
-                self.mostrar_ajuda_pagamento(chat_id)
-            
-            elif callback_data == 'config_horarios':
-                self.config_horarios_menu(chat_id)
+            # Rotas registradas em callback_router (ver CALLBACKS_SIMPLES e @rota)
+            if not callback_router.dispatch(ctx):
+                logger.debug(f"Callback sem rota: {callback_data}")
             
         except Exception as e:
             logger.error(f"Erro ao processar callback: {e}")
-            logger.error(f"Callback data: {callback_data}")
-            # Adicionar traceback para debug
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            
-            # Não mostrar erro para callbacks já tratados com try-catch específico
-            if not callback_data.startswith('confirmar_excluir_template_'):
+            logger.error(f"Callback data: {callback_query.get('data')}")
+            chat_id = callback_query.get('message', {}).get('chat', {}).get('id')
+            if chat_id:
                 self.send_message(chat_id, "❌ Erro ao processar ação.")
     
     def gerar_pix_pagamento(self, user_chat_id, callback_query_id=None):
@@ -2651,12 +1976,11 @@ Envie o comprovante para o administrador confirmar a ativação."""
     def answer_callback_query(self, callback_query_id, text=None):
         """Responde a um callback query"""
         try:
-            url = f"{self.base_url}/answerCallbackQuery"
             data = {'callback_query_id': callback_query_id}
             if text:
                 data['text'] = text
             
-            requests.post(url, json=data, timeout=5)
+            self.telegram.request('answerCallbackQuery', json=data, timeout=5)
         except Exception as e:
             logger.error(f"Erro ao responder callback: {e}")
     
@@ -2775,7 +2099,6 @@ Info: {info_adicional}
     def edit_message(self, chat_id, message_id, text, parse_mode=None, reply_markup=None):
         """Edita uma mensagem existente"""
         try:
-            url = f"{self.base_url}/editMessageText"
             data = {
                 'chat_id': chat_id,
                 'message_id': message_id,
@@ -2786,7 +2109,7 @@ Info: {info_adicional}
             if reply_markup:
                 data['reply_markup'] = json.dumps(reply_markup)
             
-            response = requests.post(url, json=data, timeout=10)
+            response = self.telegram.request('editMessageText', json=data, timeout=10)
             return response.json()
         except Exception as e:
             logger.error(f"Erro ao editar mensagem: {e}")
@@ -4396,17 +3719,13 @@ Selecione o período desejado para análise:
             
             # Verificar WhatsApp com sessionId do usuário admin
             whatsapp_status = "🔴 Desconectado"
-            try:
-                session_id = f"user_{chat_id}"
-                response = requests.get(f"http://localhost:3000/status/{session_id}", timeout=3)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('connected'):
-                        whatsapp_status = "🟢 Conectado"
-                    else:
-                        whatsapp_status = "🟡 API Online"
-            except:
-                pass
+            if self.baileys_api:
+                # Status mantido em memória pelos eventos do servidor Node (sem I/O na maior parte das vezes)
+                data = self.baileys_api.get_status(chat_id)
+                if data.get('connected'):
+                    whatsapp_status = "🟢 Conectado"
+                elif 'error' not in data:
+                    whatsapp_status = "🟡 API Online"
             
             # Templates disponíveis
             templates_count = len(self.template_manager.listar_templates(chat_id_usuario=chat_id)) if self.template_manager else 0
@@ -7457,15 +6776,12 @@ Dúvidas? Responda esta mensagem!
                 mensagem += "❌ **PostgreSQL:** Erro na verificação\n"
             
             # Verificar Baileys API
-            try:
-                import requests
-                response = requests.get("http://localhost:3000/status", timeout=5)
-                if response.status_code == 200:
-                    mensagem += "✅ **Baileys API:** Rodando\n"
-                else:
-                    mensagem += "❌ **Baileys API:** Erro na resposta\n"
-            except:
+            if not self.baileys_api:
                 mensagem += "❌ **Baileys API:** Não disponível\n"
+            elif 'error' not in self.baileys_api.get_status(chat_id):
+                mensagem += "✅ **Baileys API:** Rodando\n"
+            else:
+                mensagem += "❌ **Baileys API:** Erro na resposta\n"
             
             # Verificar Mercado Pago
             try:
@@ -8632,6 +7948,9 @@ Exemplos comuns:
                 except Exception as e:
                     jobs_status.append(f"⚠️ {nome}: Erro ao verificar")
             
+            # Horários personalizados por usuário: um job por minuto em uso, compartilhado entre usuários
+            slots = [job for job in self.scheduler.get_jobs() if job.id.startswith('slot_')]
+            
             from datetime import datetime
             agora = datetime.now()
             
@@ -8644,6 +7963,7 @@ Exemplos comuns:
 📋 *Jobs Configurados:*
 
 {chr(10).join(jobs_status)}
+⏱️ Slots de horário dos usuários: {len(slots)}
 
 ⚙️ *Configurações Ativas:*
 • Verificação diária: {horario_verificacao}
@@ -8923,27 +8243,22 @@ Exemplos comuns:
             qr_disponivel = True  # Sempre disponível para facilitar conexão
             api_online = False
             
-            try:
-                # Tentar verificar status usando sessionId específico do usuário
-                session_id = f"user_{chat_id}"
-                response = requests.get(f"http://localhost:3000/status/{session_id}", timeout=5)
-                if response.status_code == 200:
-                    api_online = True
-                    data = response.json()
-                    if data.get('connected'):
-                        status_baileys = "🟢 Conectado"
-                        qr_disponivel = False  # Já conectado, não precisa de QR
-                    elif data.get('status') == 'not_initialized':
-                        status_baileys = "🟡 API Online, Aguardando Conexão"
-                        qr_disponivel = True
-                    else:
-                        status_baileys = "🟡 API Online, WhatsApp Desconectado"
-                        qr_disponivel = True
+            # Status da sessão do usuário pelo cache de status da BaileysAPI
+            data = self.baileys_api.get_status(chat_id) if self.baileys_api else {'error': 'BaileysAPI indisponível'}
+            if 'error' in data:
+                logger.debug(f"Erro ao verificar status Baileys: {data['error']}")
+                status_baileys = "🔴 API Offline"
+            else:
+                api_online = True
+                if data.get('connected'):
+                    status_baileys = "🟢 Conectado"
+                    qr_disponivel = False  # Já conectado, não precisa de QR
+                elif data.get('estado') == 'not_initialized':
+                    status_baileys = "🟡 API Online, Aguardando Conexão"
+                    qr_disponivel = True
                 else:
-                    status_baileys = "🔴 API Offline"
-            except Exception as e:
-                logger.debug(f"Erro ao verificar status Baileys: {e}")
-                status_baileys = "🔴 API Offline (localhost:3000)"
+                    status_baileys = "🟡 API Online, WhatsApp Desconectado"
+                    qr_disponivel = True
             
             mensagem = f"""📱 *WHATSAPP/BAILEYS*
 
@@ -9207,14 +8522,12 @@ Exemplos comuns:
     def verificar_status_baileys(self, chat_id):
         """Verifica status da API Baileys em tempo real"""
         try:
-            # Usar sessionId específico do usuário para multi-sessão
-            session_id = f"user_{chat_id}"
-            response = requests.get(f"http://localhost:3000/status/{session_id}", timeout=10)
+            # Status da sessão do usuário (multi-sessão) pelo cache de status da BaileysAPI
+            data = self.baileys_api.get_status(chat_id) if self.baileys_api else {'error': 'BaileysAPI indisponível'}
             
-            if response.status_code == 200:
-                data = response.json()
+            if 'error' not in data:
                 connected = data.get('connected', False)
-                session = data.get('session', 'desconhecida')
+                session = data.get('numero', 'desconhecida')
                 qr_available = data.get('qr_available', False)
                 
                 if connected:
@@ -9361,13 +8674,8 @@ Exemplos comuns:
                                     'parse_mode': 'Markdown'
                                 }
                                 
-                                # Enviar via requests
-                                photo_response = requests.post(
-                                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                                    data=data_photo,
-                                    files=files,
-                                    timeout=30
-                                )
+                                # Enviar pela sessão HTTP compartilhada
+                                photo_response = self.telegram.send_photo(data_photo, files, timeout=30)
                                 
                                 if photo_response.status_code != 200:
                                     logger.error(f"Erro ao enviar QR Code: {photo_response.text}")
@@ -9799,10 +9107,15 @@ _Mensagem automática de teste do bot_ 🤖"""
                 except:
                     pass
             
+            # Mensagens que esgotaram as tentativas de envio
+            falhas = self.db.contar_mensagens_falhas(self._escopo_fila(chat_id)) if self.db else 0
+            botao_falhas = [{'text': f'🔁 Reenviar falhas ({falhas})', 'callback_data': 'fila_reprocessar_falhas'}]
+            aviso_falhas = f"\n\n⚠️ {falhas} mensagem(ns) falharam após todas as tentativas" if falhas else ""
+            
             if not mensagens:
-                mensagem = """📋 FILA DE MENSAGENS
+                mensagem = f"""📋 FILA DE MENSAGENS
 
-🟢 Fila vazia - Nenhuma mensagem agendada
+🟢 Fila vazia - Nenhuma mensagem agendada{aviso_falhas}
 
 💡 Mensagens são agendadas automaticamente baseado nos vencimentos dos clientes."""
                 
@@ -9810,6 +9123,8 @@ _Mensagem automática de teste do bot_ 🤖"""
                     [{'text': '🔄 Atualizar', 'callback_data': 'atualizar_fila'}],
                     [{'text': '🔙 Voltar Agendador', 'callback_data': 'agendador_menu'}]
                 ]
+                if falhas:
+                    inline_keyboard.insert(0, botao_falhas)
                 
                 self.send_message(chat_id, mensagem, 
                                 reply_markup={'inline_keyboard': inline_keyboard})
@@ -9826,7 +9141,7 @@ _Mensagem automática de teste do bot_ 🤖"""
             # Criar mensagem principal
             mensagem = f"""📋 FILA DE MENSAGENS
 
-📊 Total: {len(mensagens)} mensagens para {len(mensagens_por_cliente)} clientes
+📊 Total: {len(mensagens)} mensagens para {len(mensagens_por_cliente)} clientes{aviso_falhas}
 
 👥 CLIENTES COM MENSAGENS AGENDADAS:"""
             
@@ -9879,6 +9194,8 @@ _Mensagem automática de teste do bot_ 🤖"""
                     logger.error(f"Erro ao processar cliente na fila: {e}")
             
             # Botões de controle
+            if falhas:
+                inline_keyboard.append(botao_falhas)
             inline_keyboard.extend([
                 [
                     {'text': '🔄 Atualizar', 'callback_data': 'atualizar_fila'},
@@ -9894,6 +9211,25 @@ _Mensagem automática de teste do bot_ 🤖"""
             logger.error(f"Erro ao mostrar fila de mensagens: {e}")
             self.send_message(chat_id, "❌ Erro ao carregar fila de mensagens.")
     
+    def _escopo_fila(self, chat_id):
+        """Usuário dono das mensagens visíveis na fila (None = todos, para o admin)"""
+        return None if self.is_admin(chat_id) else chat_id
+    
+    def reprocessar_falhas_fila(self, chat_id):
+        """Devolve à fila as mensagens que esgotaram as tentativas de envio"""
+        try:
+            if not self.db:
+                self.send_message(chat_id, "❌ Erro: banco de dados não disponível.")
+                return
+            
+            reenviadas = self.db.reprocessar_mensagens_falhas(self._escopo_fila(chat_id))
+            self.send_message(chat_id, f"🔁 {reenviadas} mensagem(ns) devolvidas à fila; o reenvio começa em instantes.")
+            self.mostrar_fila_mensagens(chat_id)
+            
+        except Exception as e:
+            logger.error(f"Erro ao reprocessar falhas da fila: {e}")
+            self.send_message(chat_id, "❌ Erro ao reprocessar mensagens com falha.")
+    
     def listar_pagamentos_pendentes(self, chat_id):
         """Lista pagamentos pendentes de todos os usuários"""
         try:
@@ -11119,9 +10455,14 @@ Confirma o envio da cobrança geral?"""
             # Processar mensagem através do scheduler
             if self.scheduler:
                 try:
-                    # Enviar mensagem usando o método correto
-                    self.scheduler._enviar_mensagem_fila(mensagem_fila)
-                    self.send_message(chat_id, f"✅ Mensagem #{mensagem_id} enviada imediatamente!")
+                    # Reivindicar a mensagem para não competir com o envio agendado
+                    reivindicadas = self.db.reivindicar_mensagens_fila(ids=[mensagem_fila['id']])
+                    if not reivindicadas:
+                        self.send_message(chat_id, f"⏳ Mensagem #{mensagem_id} já está sendo enviada.")
+                    elif self.scheduler._enviar_mensagem_fila(reivindicadas[0]):
+                        self.send_message(chat_id, f"✅ Mensagem #{mensagem_id} enviada imediatamente!")
+                    else:
+                        self.send_message(chat_id, f"❌ Falha ao enviar a mensagem #{mensagem_id}. Verifique a conexão do WhatsApp.")
                         
                 except Exception as e:
                     logger.error(f"Erro ao enviar mensagem imediata: {e}")
@@ -11154,17 +10495,13 @@ Confirma o envio da cobrança geral?"""
             cliente = self.buscar_cliente_por_id(cliente_id)
             nome_cliente = cliente['nome'] if cliente else 'Cliente'
             
-            # Enviar todas as mensagens
+            # Enviar todas as mensagens pelo motor de envio (respeita o intervalo da sessão)
             enviadas = 0
             if self.scheduler:
-                for msg in mensagens_cliente:
-                    try:
-                        self.scheduler._enviar_mensagem_fila(msg)
-                        enviadas += 1
-                    except Exception as e:
-                        logger.error(f"Erro ao enviar mensagem {msg['id']}: {e}")
-            
-            self.send_message(chat_id, f"✅ {enviadas} mensagens de {nome_cliente} foram enviadas!")
+                reivindicadas = self.db.reivindicar_mensagens_fila(ids=[msg['id'] for msg in mensagens_cliente])
+                enviadas = self.scheduler.enfileirar_envios(reivindicadas)
+            
+            self.send_message(chat_id, f"📤 {enviadas} mensagens de {nome_cliente} em envio!")
             self.mostrar_fila_mensagens(chat_id)
             
         except Exception as e:
@@ -11676,6 +11013,369 @@ Entre em contato com o desenvolvedor se precisar de ajuda adicional."""
             logger.error(f"Erro no comando status: {e}")
             self.send_message(chat_id, "❌ Erro ao obter status do sistema.")
 
+# === ROTEAMENTO DE CALLBACKS DOS BOTÕES INLINE ===
+
+def _erro_callback(ctx, rota, erro):
+    """Registra a falha e avisa o usuário com a mensagem da rota (ou a genérica)"""
+    logger.error(f"Erro ao processar callback {ctx.data} ({rota.pattern}): {erro}")
+    if not isinstance(erro, CallbackArgumentError):
+        logger.error(f"Traceback: {''.join(traceback.format_exception(type(erro), erro, erro.__traceback__))}")
+    ctx.bot.send_message(ctx.chat_id, rota.erro or "❌ Erro ao processar ação.")
+
+callback_router = CallbackRouter(on_error=_erro_callback)
+rota = callback_router.route
+
+def _metodo_do_bot(caminho):
+    """Handler que chama bot.<caminho>(chat_id); caminho pode atravessar atributos ('schedule_config.status_jobs')"""
+    def handler(ctx):
+        alvo = ctx.bot
+        for atributo in caminho.split('.'):
+            alvo = getattr(alvo, atributo)
+        alvo(ctx.chat_id)
+    handler.__name__ = caminho
+    return handler
+
+# Botões que apenas abrem uma tela: callback_data -> método chamado com chat_id
+CALLBACKS_SIMPLES = {
+    # Clientes
+    'menu_clientes': 'gestao_clientes_menu',
+    'voltar_lista': 'listar_clientes',
+    'voltar_clientes': 'gestao_clientes_menu',
+    'nova_busca': 'iniciar_busca_cliente',
+    'listar_vencimentos': 'listar_vencimentos',
+    'menu_principal': 'start_command',
+    'cadastrar_outro_cliente': 'iniciar_cadastro_cliente',
+    'voltar_menu_principal': 'start_command',
+    'adicionar_cliente': 'iniciar_cadastro_cliente',
+    'listar_clientes': 'listar_clientes',
+    'listar_clientes_usuario': 'listar_clientes_usuario',
+    'cancelar': 'cancelar_operacao',
+    # Templates
+    'template_criar': 'criar_template',
+    'template_content_done': 'finalizar_conteudo_template',
+    'template_stats': 'mostrar_stats_templates',
+    'voltar_templates': 'templates_menu',
+    'templates_menu': 'templates_menu',
+    'criar_do_zero': 'criar_template_do_zero',
+    'voltar_tipo_template': 'voltar_selecao_tipo_template',
+    'confirmar_template': 'confirmar_criacao_template',
+    'editar_conteudo_template': 'editar_conteudo_template',
+    # Configurações e horários
+    'voltar_configs': 'configuracoes_menu',
+    'configuracoes_menu': 'configuracoes_menu',
+    'config_empresa': 'config_empresa',
+    'config_pix': 'config_pix',
+    'config_horarios': 'config_horarios',
+    'config_notificacoes': 'config_notificacoes',
+    'config_sistema': 'config_sistema',
+    'config_baileys_status': 'config_baileys_status',
+    'recriar_jobs': 'schedule_config.recriar_jobs',
+    'limpar_duplicatas': 'schedule_config.limpar_duplicatas',
+    'status_jobs': 'schedule_config.status_jobs',
+    'reset_horarios_padrao': 'schedule_config.resetar_horarios_padrao',
+    'edit_horario_envio': 'schedule_config.edit_horario_envio',
+    'edit_horario_verificacao': 'schedule_config.edit_horario_verificacao',
+    'edit_horario_limpeza': 'schedule_config.edit_horario_limpeza',
+    'horario_personalizado_envio': 'schedule_config.horario_personalizado_envio',
+    'horario_personalizado_verificacao': 'schedule_config.horario_personalizado_verificacao',
+    'horario_personalizado_limpeza': 'schedule_config.horario_personalizado_limpeza',
+    # Guia do usuário
+    'guia_usuario': 'mostrar_guia_usuario',
+    'guia_primeiros_passos': 'mostrar_guia_primeiros_passos',
+    'guia_whatsapp': 'mostrar_guia_whatsapp',
+    'guia_clientes': 'mostrar_guia_clientes',
+    'guia_templates': 'mostrar_guia_templates',
+    'guia_envios': 'mostrar_guia_envios',
+    'guia_automacao': 'mostrar_guia_automacao',
+    'guia_relatorios': 'mostrar_guia_relatorios',
+    'guia_problemas': 'mostrar_guia_problemas',
+    'guia_dicas': 'mostrar_guia_dicas',
+    # WhatsApp / Baileys
+    'baileys_check_status': 'config_baileys_status',
+    'baileys_menu': 'baileys_menu',
+    'baileys_qr_code': 'gerar_qr_whatsapp',
+    'baileys_pairing_code': 'solicitar_numero_telefone_pareamento',
+    'baileys_status': 'verificar_status_baileys',
+    'baileys_test': 'testar_envio_whatsapp',
+    'baileys_logs': 'mostrar_logs_baileys',
+    'baileys_stats': 'mostrar_stats_baileys',
+    'whatsapp_setup': 'whatsapp_menu',
+    'whatsapp_menu': 'whatsapp_menu',
+    # Agendador e fila
+    'agendador_status': 'mostrar_status_agendador',
+    'agendador_stats': 'mostrar_estatisticas_agendador',
+    'agendador_processar': 'processar_vencimentos_manual',
+    'agendador_logs': 'mostrar_logs_agendador',
+    'agendador_menu': 'agendador_menu',
+    'agendador_fila': 'mostrar_fila_mensagens',
+    'atualizar_fila': 'mostrar_fila_mensagens',
+    'fila_reprocessar_falhas': 'reprocessar_falhas_fila',
+    # Relatórios
+    'relatorios_usuario': 'relatorios_usuario',
+    'relatorio_mensal': 'relatorio_mensal_detalhado',
+    'relatorio_mensal_detalhado': 'relatorio_mensal_detalhado',
+    'evolucao_grafica': 'evolucao_grafica',
+    'relatorio_periodo': 'relatorio_por_periodo',
+    'relatorio_comparativo': 'relatorio_comparativo_mensal',
+    'relatorios_menu': 'mostrar_relatorios',
+    'relatorio_financeiro': 'relatorio_financeiro',
+    'relatorio_sistema': 'relatorio_sistema',
+    'relatorio_completo': 'relatorio_completo',
+    'financeiro_detalhado': 'financeiro_detalhado',
+    'financeiro_projecoes': 'financeiro_projecoes',
+    'dashboard_executivo': 'dashboard_executivo',
+    'projecoes_futuras': 'projecoes_futuras',
+    'plano_acao': 'plano_acao',
+    # Administração
+    'gestao_usuarios': 'gestao_usuarios_menu',
+    'listar_usuarios': 'listar_todos_usuarios_admin',
+    'cadastrar_usuario': 'iniciar_cadastro_usuario_admin',
+    'buscar_usuario': 'buscar_usuario_admin',
+    'estatisticas_usuarios': 'estatisticas_usuarios_admin',
+    'usuarios_vencendo': 'listar_usuarios_vencendo_admin',
+    'pagamentos_pendentes': 'listar_pagamentos_pendentes_admin',
+    'enviar_cobranca_geral': 'enviar_cobranca_geral_admin',
+    'faturamento_menu': 'faturamento_menu',
+    'faturamento_detalhado': 'faturamento_detalhado_admin',
+    'relatorio_usuarios': 'gerar_relatorio_mensal_admin',
+    # Sistema e suporte
+    'contatar_suporte': 'contatar_suporte',
+    'sistema_verificar': 'sistema_verificar_apis',
+    'sistema_logs': 'sistema_mostrar_logs',
+    'sistema_status': 'sistema_mostrar_status',
+    'sistema_restart': 'sistema_reiniciar',
+    'confirmar_restart': 'executar_restart',
+    'ajuda_pagamento': 'mostrar_ajuda_pagamento',
+}
+
+for _callback, _metodo in CALLBACKS_SIMPLES.items():
+    callback_router.add(_callback, _metodo_do_bot(_metodo))
+
+# --- Clientes ---
+
+@rota('cliente_detalhes_{cliente_id:int}')
+def _cb_cliente_detalhes(ctx, cliente_id):
+    ctx.bot.mostrar_detalhes_cliente(ctx.chat_id, cliente_id, ctx.message_id)
+
+@rota('cliente_editar_{cliente_id:int}')
+def _cb_cliente_editar(ctx, cliente_id):
+    ctx.bot.editar_cliente(ctx.chat_id, cliente_id)
+
+@rota('edit_{campo}_{cliente_id:int}')
+def _cb_editar_campo_cliente(ctx, campo, cliente_id):
+    ctx.bot.iniciar_edicao_campo(ctx.chat_id, cliente_id, campo)
+
+@rota('cliente_renovar_{cliente_id:int}')
+def _cb_cliente_renovar(ctx, cliente_id):
+    ctx.bot.renovar_cliente(ctx.chat_id, cliente_id)
+
+@rota('renovar_30dias_{cliente_id:int}')
+def _cb_renovar_30dias(ctx, cliente_id):
+    ctx.bot.processar_renovacao_30dias(ctx.chat_id, cliente_id)
+
+@rota('renovar_proximo_mes_{cliente_id:int}')
+def _cb_renovar_proximo_mes(ctx, cliente_id):
+    ctx.bot.processar_renovacao_proximo_mes(ctx.chat_id, cliente_id)
+
+@rota('renovar_nova_data_{cliente_id:int}')
+def _cb_renovar_nova_data(ctx, cliente_id):
+    ctx.bot.iniciar_renovacao_nova_data(ctx.chat_id, cliente_id)
+
+@rota('cliente_mensagem_{cliente_id:int}', 'enviar_mensagem_{cliente_id:int}')
+def _cb_enviar_mensagem_cliente(ctx, cliente_id):
+    ctx.bot.enviar_mensagem_cliente(ctx.chat_id, cliente_id)
+
+@rota('enviar_renovacao_{cliente_id:int}_{template_id:int}')
+def _cb_enviar_renovacao(ctx, cliente_id, template_id):
+    ctx.bot.enviar_mensagem_renovacao(ctx.chat_id, cliente_id, template_id)
+
+@rota('cliente_excluir_{cliente_id:int}')
+def _cb_cliente_excluir(ctx, cliente_id):
+    ctx.bot.confirmar_exclusao_cliente(ctx.chat_id, cliente_id, ctx.message_id)
+
+@rota('confirmar_excluir_cliente_{cliente_id:int}')
+def _cb_confirmar_excluir_cliente(ctx, cliente_id):
+    ctx.bot.excluir_cliente(ctx.chat_id, cliente_id, ctx.message_id)
+
+@rota('cliente_notificacoes_{cliente_id:int}')
+def _cb_cliente_notificacoes(ctx, cliente_id):
+    ctx.bot.configurar_notificacoes_cliente(ctx.chat_id, cliente_id, ctx.message_id)
+
+@rota('toggle_cobranca_{cliente_id:int}')
+def _cb_toggle_cobranca(ctx, cliente_id):
+    ctx.bot.toggle_notificacao_cobranca(ctx.chat_id, cliente_id, ctx.message_id)
+
+@rota('toggle_notificacoes_{cliente_id:int}')
+def _cb_toggle_notificacoes(ctx, cliente_id):
+    ctx.bot.toggle_notificacao_geral(ctx.chat_id, cliente_id, ctx.message_id)
+
+# --- Templates ---
+
+@rota('template_detalhes_{template_id:int}')
+def _cb_template_detalhes(ctx, template_id):
+    ctx.bot.mostrar_detalhes_template(ctx.chat_id, template_id, ctx.message_id)
+
+@rota('template_editar_{template_id:int}')
+def _cb_template_editar(ctx, template_id):
+    ctx.bot.editar_template(ctx.chat_id, template_id)
+
+@rota('template_excluir_{template_id:int}')
+def _cb_template_excluir(ctx, template_id):
+    ctx.bot.confirmar_exclusao_template(ctx.chat_id, template_id, ctx.message_id)
+
+@rota('confirmar_excluir_template_{template_id:int}', erro="❌ Erro ao processar exclusão.")
+def _cb_confirmar_excluir_template(ctx, template_id):
+    ctx.bot.excluir_template(ctx.chat_id, template_id, ctx.message_id)
+
+@rota('template_enviar_{template_id:int}')
+def _cb_template_enviar(ctx, template_id):
+    ctx.bot.selecionar_cliente_template(ctx.chat_id, template_id)
+
+@rota('copy_tag_{tag_nome:rest}')
+def _cb_copiar_tag(ctx, tag_nome):
+    ctx.bot.copiar_tag_template(ctx.chat_id, tag_nome)
+
+@rota('usar_modelo_{tipo:rest}')
+def _cb_usar_modelo(ctx, tipo):
+    ctx.bot.usar_template_modelo(ctx.chat_id, tipo)
+
+@rota('editar_modelo_{tipo:rest}')
+def _cb_editar_modelo(ctx, tipo):
+    ctx.bot.editar_template_modelo(ctx.chat_id, tipo)
+
+@rota('edit_template_{campo}_{template_id:int}', erro="❌ Erro ao processar edição.")
+def _cb_editar_campo_template(ctx, campo, template_id):
+    ctx.bot.iniciar_edicao_template_campo(ctx.chat_id, template_id, campo)
+
+@rota('set_template_tipo_{template_id:int}_{tipo:rest}', erro="❌ Erro ao atualizar tipo.")
+def _cb_template_tipo(ctx, template_id, tipo):
+    ctx.bot.atualizar_template_tipo(ctx.chat_id, template_id, tipo)
+
+@rota('set_template_status_{template_id:int}_{status:bool}', erro="❌ Erro ao atualizar status.")
+def _cb_template_status(ctx, template_id, status):
+    ctx.bot.atualizar_template_status(ctx.chat_id, template_id, status)
+
+# --- Envio de mensagens ---
+
+@rota('enviar_template_{cliente_id:int}_{template_id:int}', erro="❌ Erro ao processar template.")
+def _cb_enviar_template(ctx, cliente_id, template_id):
+    ctx.bot.enviar_template_para_cliente(ctx.chat_id, cliente_id, template_id)
+
+@rota('confirmar_envio_{cliente_id:int}_{template_id:int}', erro="❌ Erro ao enviar mensagem.")
+def _cb_confirmar_envio(ctx, cliente_id, template_id):
+    ctx.bot.confirmar_envio_mensagem(ctx.chat_id, cliente_id, template_id)
+
+@rota('mensagem_custom_{cliente_id:int}', erro="❌ Erro ao inicializar mensagem personalizada.")
+def _cb_mensagem_custom(ctx, cliente_id):
+    iniciar_mensagem_personalizada_global(ctx.chat_id, cliente_id)
+
+# --- Configurações e horários ---
+
+@rota('set_envio_{horario:rest}')
+def _cb_set_envio(ctx, horario):
+    ctx.bot.schedule_config.set_horario_envio(ctx.chat_id, horario)
+
+@rota('set_verificacao_{horario:rest}')
+def _cb_set_verificacao(ctx, horario):
+    ctx.bot.schedule_config.set_horario_verificacao(ctx.chat_id, horario)
+
+@rota('set_limpeza_{horario:rest}')
+def _cb_set_limpeza(ctx, horario):
+    ctx.bot.schedule_config.set_horario_limpeza(ctx.chat_id, horario)
+
+@rota('edit_config_pix_chave')
+def _cb_editar_pix_chave(ctx):
+    ctx.bot.iniciar_edicao_config(ctx.chat_id, 'empresa_pix', 'Chave PIX')
+
+@rota('edit_config_pix_titular')
+def _cb_editar_pix_titular(ctx):
+    ctx.bot.iniciar_edicao_config(ctx.chat_id, 'empresa_titular', 'Titular da Conta')
+
+@rota('edit_config_{tipo}_{campo}', erro="❌ Erro ao iniciar edição.")
+def _cb_editar_config(ctx, tipo, campo):
+    ctx.bot.iniciar_edicao_config(ctx.chat_id, f"{tipo}_{campo}", f"{tipo.title()} {campo.title()}")
+
+@rota('toggle_notif_{status_atual}')
+def _cb_toggle_notificacoes_sistema(ctx, status_atual):
+    ctx.bot.toggle_notificacoes_sistema(ctx.chat_id, status_atual)
+
+# --- Fila de mensagens ---
+
+@rota('cancelar_msg_{msg_id:int}', erro="❌ Erro ao cancelar mensagem.")
+def _cb_cancelar_msg(ctx, msg_id):
+    ctx.bot.cancelar_mensagem_agendada(ctx.chat_id, msg_id)
+
+@rota('fila_cliente_{msg_id:int}_{cliente_id:int}', erro="❌ Erro ao carregar opções do cliente.")
+def _cb_fila_cliente(ctx, msg_id, cliente_id):
+    ctx.bot.mostrar_opcoes_cliente_fila(ctx.chat_id, msg_id, cliente_id)
+
+@rota('enviar_agora_{msg_id:int}', erro="❌ Erro ao enviar mensagem.")
+def _cb_enviar_agora(ctx, msg_id):
+    ctx.bot.enviar_mensagem_agora(ctx.chat_id, msg_id)
+
+@rota('enviar_agora_cliente_{cliente_id:int}', erro="❌ Erro ao enviar mensagens do cliente.")
+def _cb_enviar_agora_cliente(ctx, cliente_id):
+    ctx.bot.enviar_todas_mensagens_cliente_agora(ctx.chat_id, cliente_id)
+
+@rota('cancelar_cliente_{cliente_id:int}', erro="❌ Erro ao cancelar mensagens do cliente.")
+def _cb_cancelar_cliente(ctx, cliente_id):
+    ctx.bot.cancelar_todas_mensagens_cliente(ctx.chat_id, cliente_id)
+
+# --- Pagamentos e conta do usuário ---
+
+@rota('gerar_pix_{user_chat_id:int}')
+def _cb_gerar_pix(ctx, user_chat_id):
+    ctx.bot.gerar_pix_pagamento(user_chat_id, ctx.callback_query_id)
+
+@rota('gerar_pix_usuario_{user_id:rest}')
+def _cb_gerar_pix_usuario(ctx, user_id):
+    ctx.bot.processar_gerar_pix_usuario(ctx.chat_id, user_id)
+
+@rota('gerar_pix_renovacao_{user_id:rest}')
+def _cb_gerar_pix_renovacao(ctx, user_id):
+    ctx.bot.processar_gerar_pix_renovacao(ctx.chat_id, user_id)
+
+@rota('verificar_pix_{payment_id:rest}')
+def _cb_verificar_pix(ctx, payment_id):
+    ctx.bot.verificar_pix_pagamento(ctx.chat_id, payment_id)
+
+@rota('verificar_pagamento_{payment_id:rest}')
+def _cb_verificar_pagamento(ctx, payment_id):
+    ctx.bot.verificar_pagamento_manual(ctx.chat_id, payment_id)
+
+@rota('alterar_dados')
+def _cb_alterar_dados(ctx):
+    ctx.bot.alterar_dados_usuario(ctx.chat_id)
+    ctx.bot.answer_callback_query(ctx.callback_query_id, "📧 Alterando dados")
+
+@rota('alterar_nome', 'alterar_email', 'alterar_telefone', 'alterar_todos')
+def _cb_alterar_campo_usuario(ctx):
+    ctx.bot.processar_alteracao_dados(ctx.chat_id, ctx.data)
+    ctx.bot.answer_callback_query(ctx.callback_query_id, "✏️ Alterando...")
+
+@rota('minha_conta')
+def _cb_minha_conta(ctx):
+    ctx.bot.minha_conta_menu(ctx.chat_id)
+    ctx.bot.answer_callback_query(ctx.callback_query_id, "💳 Minha Conta")
+
+@rota('historico_pagamentos')
+def _cb_historico_pagamentos(ctx):
+    ctx.bot.historico_pagamentos(ctx.chat_id)
+    ctx.bot.answer_callback_query(ctx.callback_query_id, "📊 Histórico")
+
+# --- Relatórios ---
+
+DIAS_POR_PERIODO = {
+    'periodo_7_dias': 7,
+    'periodo_30_dias': 30,
+    'periodo_3_meses': 90,
+    'periodo_6_meses': 180
+}
+
+@rota('periodo_{periodo:rest}')
+def _cb_relatorio_periodo(ctx, periodo):
+    ctx.bot.gerar_relatorio_periodo(ctx.chat_id, DIAS_POR_PERIODO.get(ctx.data, 30))
+
 # Instância global do bot
 telegram_bot = None
 bot_instance = None
@@ -11697,7 +11397,7 @@ def initialize_bot():
         bot_instance = telegram_bot  # Definir bot_instance para compatibilidade
         
         # Testar conexão
-        response = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getMe", timeout=10)
+        response = telegram_bot.telegram.get_me(timeout=10)
         if response.status_code == 200:
             bot_info = response.json()
             if bot_info.get('ok'):
@@ -11709,6 +11409,7 @@ def initialize_bot():
                 else:
                     logger.warning("⚠️ Alguns serviços falharam na inicialização")
                 
+                iniciar_dispatcher()
                 return True
         
         return False
@@ -11717,6 +11418,17 @@ def initialize_bot():
         logger.error(f"Erro ao inicializar bot: {e}")
         return False
 
+def _processar_update(update):
+    telegram_bot.process_message(update)
+
+def iniciar_dispatcher():
+    """Cria e inicia o despachante compartilhado por polling e webhook"""
+    global update_dispatcher
+    if update_dispatcher is None:
+        update_dispatcher = UpdateDispatcher(_processar_update)
+        update_dispatcher.start()
+    return update_dispatcher
+
 @app.route('/')
 def home():
     """Página inicial do bot"""
@@ -11740,21 +11452,17 @@ def health_check():
         # Verificar mensagens pendentes (se bot está disponível)
         mensagens_pendentes = 0
         baileys_connected = False
+        baileys_sessoes = 0
         scheduler_running = False
         
         try:
             if telegram_bot and hasattr(telegram_bot, 'db'):
-                mensagens_pendentes = len(telegram_bot.db.obter_mensagens_pendentes())
+                mensagens_pendentes = telegram_bot.db.contar_mensagens_pendentes()
             
-            # Verificar conexão Baileys (opcional)
-            try:
-                import requests
-                # Usar sessionId padrão para verificação geral
-                response = requests.get("http://localhost:3000/status/default", timeout=1)
-                if response.status_code == 200:
-                    baileys_connected = response.json().get('connected', False)
-            except:
-                baileys_connected = False  # Não é crítico
+            # Conexão Baileys (opcional): status mantido em memória pelos eventos do servidor Node
+            if telegram_bot and telegram_bot.baileys_api:
+                baileys_sessoes = len(telegram_bot.baileys_api.connected_sessions())
+                baileys_connected = baileys_sessoes > 0
                 
             # Verificar scheduler (opcional)
             if telegram_bot and hasattr(telegram_bot, 'scheduler'):
@@ -11781,7 +11489,16 @@ def health_check():
             'metrics': {
                 'pending_messages': mensagens_pendentes,
                 'baileys_connected': baileys_connected,
-                'scheduler_running': scheduler_running
+                'baileys_sessions_connected': baileys_sessoes,
+                'baileys_cache': telegram_bot.baileys_api.cache_stats()
+                if telegram_bot and telegram_bot.baileys_api else None,
+                'scheduler_running': scheduler_running,
+                'dispatcher': update_dispatcher.stats() if update_dispatcher else None,
+                'telegram_rate_limiter': telegram_bot.telegram.limiter.stats() if telegram_bot else None,
+                'whatsapp_send_engine': telegram_bot.scheduler.send_engine.stats()
+                if telegram_bot and telegram_bot.scheduler else None,
+                'scheduler_leader': telegram_bot.scheduler.is_leader
+                if telegram_bot and telegram_bot.scheduler else None
             },
             'uptime': 'ok',
             'version': '1.0.0',
@@ -11808,6 +11525,11 @@ def status():
         'timestamp': datetime.now(TIMEZONE_BR).isoformat()
     })
 
+@app.route('/metrics/callbacks')
+def callback_metrics():
+    """Acionamentos e latência por rota de callback"""
+    return jsonify(callback_router.stats())
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Webhook para receber updates do Telegram"""
@@ -11818,7 +11540,9 @@ def webhook():
         update = request.get_json()
         if update:
             logger.info(f"Update recebido: {update}")
-            telegram_bot.process_message(update)
+            if not iniciar_dispatcher().submit(update, timeout=BOT_QUEUE_TIMEOUT):
+                # Fila cheia: Telegram reenvia o update quando a resposta não é 2xx
+                return jsonify({'error': 'Fila de updates cheia'}), 503
             return jsonify({'status': 'ok'})
         else:
             return jsonify({'error': 'Dados inválidos'}), 400
@@ -11846,72 +11570,118 @@ def send_test():
         logger.error(f"Erro ao enviar teste: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _bot_id():
+    """ID numérico do bot (prefixo do token), chave do offset persistido"""
+    try:
+        return int(BOT_TOKEN.split(':', 1)[0])
+    except (AttributeError, ValueError):
+        return 0
+
+def _carregar_offset():
+    """Último update_id confirmado, lido do banco uma vez e depois mantido em memória"""
+    global _ultimo_update_id, _offset_carregado
+    if not _offset_carregado and telegram_bot and telegram_bot.db:
+        persistido = telegram_bot.db.obter_offset_telegram(_bot_id())
+        if persistido is not None and persistido > _ultimo_update_id:
+            _ultimo_update_id = persistido
+        _offset_carregado = True
+    return _ultimo_update_id
+
+def _confirmar_update(update):
+    """Marca update como concluído e avança o offset persistido até a marca d'água
+
+    O offset só avança até o maior update_id sem nenhum anterior em andamento, de
+    forma que um reinício nunca pule um update que ainda estava na fila.
+    """
+    global _ultimo_update_id
+    with _offset_lock:
+        _em_andamento.discard(update['update_id'])
+        confirmado = min(_em_andamento) - 1 if _em_andamento else _maior_despachado
+        if confirmado <= _ultimo_update_id:
+            return
+        _ultimo_update_id = confirmado
+    if telegram_bot and telegram_bot.db:
+        telegram_bot.db.salvar_offset_telegram(_bot_id(), confirmado)
+
+def _buscar_e_despachar_updates(timeout):
+    """Executa um getUpdates a partir do offset confirmado e entrega o lote ao despachante
+
+    Retorna (novos, recebidos) ou None se a API retornou erro. Updates ainda em
+    andamento voltam no getUpdates (o offset só é confirmado após o processamento)
+    e são ignorados aqui; assim um crash nunca perde update despachado. Em troca,
+    com TELEGRAM_POLL_LIMIT updates em andamento a partir do mais antigo, os
+    seguintes só chegam quando ele concluir.
+    """
+    global _maior_despachado
+    ultimo = _carregar_offset()
+    params = {'limit': TELEGRAM_POLL_LIMIT, 'timeout': timeout}
+    if ultimo:
+        params['offset'] = ultimo + 1
+    # Timeout HTTP precisa cobrir o long polling do lado do Telegram
+    response = telegram_bot.telegram.get_updates(params=params, timeout=timeout + 10)
+    if response.status_code != 200:
+        logger.error(f"Erro no getUpdates: {response.status_code} - {response.text}")
+        return None
+
+    data = response.json()
+    if not data.get('ok'):
+        return None
+
+    updates = data.get('result', [])
+    dispatcher = iniciar_dispatcher()
+    novos = 0
+    for update in updates:
+        update_id = update.get('update_id')
+        with _offset_lock:
+            if update_id <= max(_maior_despachado, _ultimo_update_id):
+                continue
+            _maior_despachado = update_id
+            _em_andamento.add(update_id)
+        # Sem timeout: fila cheia segura o polling (backpressure)
+        if not dispatcher.submit(update, on_done=_confirmar_update):
+            _processar_update(update)
+            _confirmar_update(update)
+        novos += 1
+    return novos, len(updates)
+
 def process_pending_messages():
-    """Processa mensagens pendentes do Telegram"""
+    """Processa imediatamente os updates pendentes do Telegram (sem long polling)"""
     if not telegram_bot or not BOT_TOKEN:
         return
     
+    # Se o loop de polling estiver em um getUpdates, ele mesmo entrega os pendentes
+    if not _polling_lock.acquire(blocking=False):
+        logger.info("Polling ativo - updates pendentes serão entregues por ele")
+        return
     try:
-        response = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates", timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('ok'):
-                updates = data.get('result', [])
-                if updates:
-                    logger.info(f"Processando {len(updates)} mensagens pendentes...")
-                    
-                    for update in updates:
-                        logger.info(f"Processando update: {update.get('update_id')}")
-                        telegram_bot.process_message(update)
-                    
-                    # Marcar como processadas
-                    last_update_id = updates[-1]['update_id']
-                    requests.get(
-                        f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates",
-                        params={'offset': last_update_id + 1},
-                        timeout=5
-                    )
-                    logger.info(f"Mensagens processadas até ID: {last_update_id}")
-    
+        total = 0
+        while True:
+            resultado = _buscar_e_despachar_updates(timeout=0)
+            if not resultado or not resultado[0]:
+                break
+            total += resultado[0]
+        if total:
+            logger.info(f"{total} mensagens pendentes despachadas")
     except Exception as e:
         logger.error(f"Erro ao processar mensagens pendentes: {e}")
+    finally:
+        _polling_lock.release()
 
 def polling_loop():
-    """Loop de polling otimizado para resposta rápida"""
-    logger.info("Iniciando polling contínuo do Telegram...")
-    
-    last_update_id = 0
+    """Loop de long polling: uma requisição aberta por até TELEGRAM_POLL_TIMEOUT segundos"""
+    logger.info(f"Iniciando polling contínuo do Telegram "
+                f"(timeout={TELEGRAM_POLL_TIMEOUT}s, limit={TELEGRAM_POLL_LIMIT})...")
     
     while True:
         try:
             if telegram_bot and BOT_TOKEN:
-                # Usar long polling para resposta mais rápida
-                response = requests.get(
-                    f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates",
-                    params={
-                        'offset': last_update_id + 1,
-                        'limit': 10,
-                        'timeout': 1  # Long polling de 1 segundo
-                    },
-                    timeout=5
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('ok'):
-                        updates = data.get('result', [])
-                        
-                        for update in updates:
-                            try:
-                                update_id = update.get('update_id')
-                                if update_id > last_update_id:
-                                    # Processar imediatamente
-                                    telegram_bot.process_message(update)
-                                    last_update_id = update_id
-                            except Exception as e:
-                                logger.error(f"Erro ao processar update {update.get('update_id')}: {e}")
-                else:
-                    time.sleep(0.2)  # Pausa pequena se API retornar erro
+                with _polling_lock:
+                    resultado = _buscar_e_despachar_updates(timeout=TELEGRAM_POLL_TIMEOUT)
+                if resultado is None:
+                    time.sleep(1)  # Pausa se API retornar erro (ex.: 409 com webhook ativo)
+                elif resultado[1] and not resultado[0]:
+                    # Só vieram updates em andamento: esperar algum concluir antes de buscar de novo
+                    update_dispatcher.aguardar_conclusao(1)
             else:
                 time.sleep(1)  # Bot não inicializado
                 
@@ -12760,10 +12530,7 @@ def main_with_baileys():
             logger.info("✅ Bot completo inicializado com sucesso")
             # Adicionar métodos de WhatsApp
             add_whatsapp_methods()
-            # Processar mensagens pendentes após inicialização
-            logger.info("Processando mensagens pendentes...")
-            process_pending_messages()
-            # Iniciar polling contínuo
+            # Polling retoma do offset persistido, entregando o que ficou pendente
             start_polling_thread()
         else:
             logger.warning("⚠️ Bot não inicializado completamente, mas servidor Flask será executado")
@@ -12800,10 +12567,7 @@ if __name__ == '__main__':
             logger.info("✅ Bot completo inicializado com sucesso")
             # Adicionar métodos de WhatsApp
             add_whatsapp_methods()
-            # Processar mensagens pendentes após inicialização
-            logger.info("Processando mensagens pendentes...")
-            process_pending_messages()
-            # Iniciar polling contínuo
+            # Polling retoma do offset persistido, entregando o que ficou pendente
             start_polling_thread()
         else:
             logger.warning("⚠️ Bot não inicializado completamente, mas servidor Flask será executado")
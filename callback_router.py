@@ -0,0 +1,222 @@
+"""
+Roteador de callback_data dos botões inline
+Rotas estáticas em dicionário, rotas parametrizadas em trie de prefixos e contadores por rota
+"""
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Tipos aceitos nos parâmetros: {nome:tipo}
+TIPOS_PARAMETRO = {
+    'int': (r'-?\d+', int),
+    'str': (r'[^_]+', str),
+    'rest': (r'.+', str),
+    'bool': (r'[^_]+', lambda valor: valor == 'True'),
+}
+
+_PARAMETRO = re.compile(r'\{(\w+)(?::(\w+))?\}')
+
+
+class CallbackArgumentError(Exception):
+    """callback_data casou com o prefixo de uma rota mas os argumentos não puderam ser lidos"""
+
+    def __init__(self, route, data):
+        super().__init__(f"Argumentos inválidos para {route.pattern}: {data}")
+        self.route = route
+        self.data = data
+
+
+class CallbackContext:
+    """Dados do callback entregues aos handlers"""
+
+    __slots__ = ('bot', 'callback_query', 'chat_id', 'message_id', 'callback_query_id', 'data')
+
+    def __init__(self, bot, callback_query):
+        self.bot = bot
+        self.callback_query = callback_query
+        self.chat_id = callback_query['message']['chat']['id']
+        self.message_id = callback_query['message']['message_id']
+        self.callback_query_id = callback_query['id']
+        self.data = callback_query['data']
+
+
+class CallbackRoute:
+    """Rota compilada: prefixo literal + expressão para os parâmetros tipados"""
+
+    def __init__(self, pattern, handler, erro=None):
+        self.pattern = pattern
+        self.handler = handler
+        self.erro = erro
+        self.name = getattr(handler, '__name__', pattern)
+
+        inicio = pattern.find('{')
+        self.prefix = pattern if inicio < 0 else pattern[:inicio]
+        self.exact = inicio < 0
+        self._regex = None
+        self._conversores = {}
+        if not self.exact:
+            partes = []
+            posicao = inicio
+            for parametro in _PARAMETRO.finditer(pattern, inicio):
+                nome, tipo = parametro.group(1), parametro.group(2) or 'str'
+                if tipo not in TIPOS_PARAMETRO:
+                    raise ValueError(f"Tipo de parâmetro desconhecido em {pattern}: {tipo}")
+                regex, conversor = TIPOS_PARAMETRO[tipo]
+                partes.append(re.escape(pattern[posicao:parametro.start()]))
+                partes.append(f'(?P<{nome}>{regex})')
+                self._conversores[nome] = conversor
+                posicao = parametro.end()
+            partes.append(re.escape(pattern[posicao:]))
+            self._regex = re.compile(''.join(partes))
+
+        self.hits = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def parse(self, data):
+        """Converte o restante do callback_data nos argumentos da rota (None se não casar)"""
+        if self.exact:
+            return {}
+        encontrado = self._regex.fullmatch(data, len(self.prefix))
+        if not encontrado:
+            return None
+        try:
+            return {nome: self._conversores[nome](valor) for nome, valor in encontrado.groupdict().items()}
+        except ValueError:
+            return None
+
+
+class _No:
+    __slots__ = ('filhos', 'rotas')
+
+    def __init__(self):
+        self.filhos = {}
+        self.rotas = []
+
+
+class CallbackRouter:
+    """Resolve callback_data em O(1) para rotas estáticas e O(len) para parametrizadas
+
+    Entre rotas parametrizadas vence o prefixo literal mais longo; se os argumentos
+    não casarem, tenta os prefixos mais curtos antes de desistir. Erros de argumento
+    e exceções dos handlers são entregues a on_error(ctx, rota, erro), se informado.
+    """
+
+    def __init__(self, on_error=None):
+        self.on_error = on_error
+        self._exatas = {}
+        self._raiz = _No()
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    def add(self, pattern, handler, erro=None):
+        """Registra handler(ctx, **args) para o padrão informado"""
+        rota = CallbackRoute(pattern, handler, erro)
+        if rota.exact:
+            if pattern in self._exatas:
+                raise ValueError(f"Rota duplicada: {pattern}")
+            self._exatas[pattern] = rota
+        else:
+            no = self._raiz
+            for caractere in rota.prefix:
+                no = no.filhos.setdefault(caractere, _No())
+            no.rotas.append(rota)
+        return rota
+
+    def route(self, *patterns, erro=None):
+        """Decorador de registro; aceita vários padrões para o mesmo handler"""
+        def decorador(handler):
+            for pattern in patterns:
+                self.add(pattern, handler, erro)
+            return handler
+        return decorador
+
+    def resolve(self, data):
+        """Retorna (rota, argumentos) ou None; CallbackArgumentError se só os argumentos falharem"""
+        rota = self._exatas.get(data)
+        if rota is not None:
+            return rota, {}
+
+        candidatos = []
+        no = self._raiz
+        for caractere in data:
+            no = no.filhos.get(caractere)
+            if no is None:
+                break
+            if no.rotas:
+                candidatos.append(no)
+
+        for no in reversed(candidatos):
+            for rota in no.rotas:
+                argumentos = rota.parse(data)
+                if argumentos is not None:
+                    return rota, argumentos
+        if candidatos:
+            raise CallbackArgumentError(candidatos[-1].rotas[0], data)
+        return None
+
+    def dispatch(self, ctx):
+        """Executa o handler da rota; retorna False se nenhuma rota atende o callback"""
+        try:
+            resolvido = self.resolve(ctx.data)
+        except CallbackArgumentError as e:
+            with self._lock:
+                e.route.errors += 1
+            self._erro(ctx, e.route, e)
+            return True
+        if resolvido is None:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        rota, argumentos = resolvido
+        falha = None
+        inicio = time.perf_counter()
+        try:
+            rota.handler(ctx, **argumentos)
+        except Exception as e:
+            falha = e
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            rota.hits += 1
+            rota.total_seconds += duracao
+            rota.max_seconds = max(rota.max_seconds, duracao)
+            if falha is not None:
+                rota.errors += 1
+        if falha is not None:
+            self._erro(ctx, rota, falha)
+        return True
+
+    def _erro(self, ctx, rota, erro):
+        if self.on_error is None:
+            raise erro
+        self.on_error(ctx, rota, erro)
+
+    def routes(self):
+        """Todas as rotas registradas"""
+        rotas = list(self._exatas.values())
+        pendentes = [self._raiz]
+        while pendentes:
+            no = pendentes.pop()
+            rotas.extend(no.rotas)
+            pendentes.extend(no.filhos.values())
+        return rotas
+
+    def stats(self):
+        """Contadores por rota, das mais acionadas para as menos"""
+        with self._lock:
+            rotas = [{
+                'pattern': rota.pattern,
+                'handler': rota.name,
+                'hits': rota.hits,
+                'errors': rota.errors,
+                'avg_ms': round(rota.total_seconds * 1000 / rota.hits, 2) if rota.hits else 0.0,
+                'max_ms': round(rota.max_seconds * 1000, 2)
+            } for rota in self.routes()]
+            misses = self.misses
+        rotas.sort(key=lambda rota: (-rota['hits'], rota['pattern']))
+        return {'routes': rotas, 'misses': misses}
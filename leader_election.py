@@ -0,0 +1,119 @@
+"""
+Eleição de líder entre réplicas
+Lock consultivo (advisory lock) do PostgreSQL mantido em uma conexão dedicada: quem o detém é o líder
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_ID = int(os.getenv('LEADER_LOCK_ID', '7301001'))
+LEADER_CHECK_INTERVAL = float(os.getenv('LEADER_CHECK_INTERVAL', '5'))
+
+
+class LeaderElection:
+    """Disputa o lock periodicamente; o lock cai junto com a conexão se o líder morrer
+
+    O líder confere a conexão a cada intervalo e, se ela falhar, assume que perdeu
+    o lock e chama on_revoked antes que outra réplica possa assumir. As demais
+    tentam pg_try_advisory_lock no mesmo intervalo, então o failover leva alguns
+    segundos (intervalo + detecção da queda pelo servidor via keepalive).
+    """
+
+    def __init__(self, connect, on_elected, on_revoked, lock_id=LEADER_LOCK_ID,
+                 intervalo=LEADER_CHECK_INTERVAL, nome='agendador'):
+        self.connect = connect
+        self.on_elected = on_elected
+        self.on_revoked = on_revoked
+        self.lock_id = lock_id
+        self.intervalo = intervalo
+        self.nome = nome
+
+        self._conn = None
+        self._lider = False
+        self._parar = threading.Event()
+        self._thread = None
+        self._stats = {'elected': 0, 'revoked': 0, 'errors': 0}
+
+    @property
+    def is_leader(self):
+        return self._lider
+
+    def start(self):
+        """Inicia a disputa em segundo plano"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"leader-{self.nome}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Para a disputa e libera o lock, se for o líder"""
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._lider:
+            try:
+                with self._conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (self.lock_id,))
+            except Exception as e:
+                logger.error(f"Erro ao liberar lock de líder ({self.nome}): {e}")
+            self._revogar()
+        self._fechar_conexao()
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = self.connect()
+                    self._conn.autocommit = True
+                with self._conn.cursor() as cursor:
+                    if self._lider:
+                        cursor.execute("SELECT 1")
+                        cursor.fetchone()
+                    else:
+                        cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+                        if cursor.fetchone()[0]:
+                            self._assumir()
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.error(f"Erro na eleição de líder ({self.nome}): {e}")
+                # Sem conexão não há garantia de ainda deter o lock
+                if self._lider:
+                    self._revogar()
+                self._fechar_conexao()
+            self._parar.wait(self.intervalo)
+
+    def _assumir(self):
+        self._lider = True
+        self._stats['elected'] += 1
+        logger.info(f"👑 Esta réplica assumiu a liderança ({self.nome})")
+        try:
+            self.on_elected()
+        except Exception as e:
+            # Liderança sem o trabalho rodando bloquearia as outras réplicas
+            logger.error(f"Erro ao assumir liderança ({self.nome}): {e}")
+            self._revogar()
+            self._fechar_conexao()
+
+    def _revogar(self):
+        self._lider = False
+        self._stats['revoked'] += 1
+        logger.warning(f"⚠️ Esta réplica deixou a liderança ({self.nome})")
+        try:
+            self.on_revoked()
+        except Exception as e:
+            logger.error(f"Erro ao deixar liderança ({self.nome}): {e}")
+
+    def _fechar_conexao(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def stats(self):
+        return dict(self._stats, leader=self._lider, lock_id=self.lock_id)
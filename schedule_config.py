@@ -265,21 +265,12 @@ Esta limpeza remove mensagens antigas da fila que não foram enviadas.
             
             # Salvar configuração com isolamento por usuário
             try:
-                with self.bot.db.get_connection() as conn:
-                    with conn.cursor() as cursor:
-                        # Deletar configuração existente do usuário
-                        cursor.execute('''
-                            DELETE FROM configuracoes 
-                            WHERE chave = %s AND chat_id_usuario = %s
-                        ''', ('horario_envio_diario', chat_id))
-                        
-                        # Inserir nova configuração
-                        cursor.execute('''
-                            INSERT INTO configuracoes (chave, valor, descricao, chat_id_usuario)
-                            VALUES (%s, %s, %s, %s)
-                        ''', ('horario_envio_diario', horario_formatado, f'Horário personalizado do usuário', chat_id))
-                        
-                        conn.commit()
+                # salvar_configuracao faz o upsert e invalida o cache de configurações do usuário
+                if not self.bot.db.salvar_configuracao('horario_envio_diario', horario_formatado,
+                                                       descricao='Horário personalizado do usuário',
+                                                       chat_id_usuario=chat_id):
+                    raise Exception("falha ao salvar configuração")
+                self._aplicar_horarios_usuario(chat_id)
                 
                 mensagem = f"✅ Horário de envio alterado para {horario_formatado}!\n\n"
                 mensagem += "📅 O novo horário foi aplicado ao seu perfil.\n"
@@ -307,21 +298,12 @@ Esta limpeza remove mensagens antigas da fila que não foram enviadas.
             
             # Salvar configuração com isolamento por usuário
             try:
-                with self.bot.db.get_connection() as conn:
-                    with conn.cursor() as cursor:
-                        # Deletar configuração existente do usuário
-                        cursor.execute('''
-                            DELETE FROM configuracoes 
-                            WHERE chave = %s AND chat_id_usuario = %s
-                        ''', ('horario_verificacao_diaria', chat_id))
-                        
-                        # Inserir nova configuração
-                        cursor.execute('''
-                            INSERT INTO configuracoes (chave, valor, descricao, chat_id_usuario)
-                            VALUES (%s, %s, %s, %s)
-                        ''', ('horario_verificacao_diaria', horario_formatado, f'Horário personalizado do usuário', chat_id))
-                        
-                        conn.commit()
+                # salvar_configuracao faz o upsert e invalida o cache de configurações do usuário
+                if not self.bot.db.salvar_configuracao('horario_verificacao_diaria', horario_formatado,
+                                                       descricao='Horário personalizado do usuário',
+                                                       chat_id_usuario=chat_id):
+                    raise Exception("falha ao salvar configuração")
+                self._aplicar_horarios_usuario(chat_id)
                 
                 mensagem = f"✅ Horário de verificação alterado para {horario_formatado}!\n\n"
                 mensagem += "📅 O novo horário foi aplicado ao seu perfil.\n"
@@ -349,21 +331,11 @@ Esta limpeza remove mensagens antigas da fila que não foram enviadas.
             
             # Salvar configuração com isolamento por usuário
             try:
-                with self.bot.db.get_connection() as conn:
-                    with conn.cursor() as cursor:
-                        # Deletar configuração existente do usuário
-                        cursor.execute('''
-                            DELETE FROM configuracoes 
-                            WHERE chave = %s AND chat_id_usuario = %s
-                        ''', ('horario_limpeza_fila', chat_id))
-                        
-                        # Inserir nova configuração
-                        cursor.execute('''
-                            INSERT INTO configuracoes (chave, valor, descricao, chat_id_usuario)
-                            VALUES (%s, %s, %s, %s)
-                        ''', ('horario_limpeza_fila', horario_formatado, f'Horário personalizado do usuário', chat_id))
-                        
-                        conn.commit()
+                # salvar_configuracao faz o upsert e invalida o cache de configurações do usuário
+                if not self.bot.db.salvar_configuracao('horario_limpeza_fila', horario_formatado,
+                                                       descricao='Horário personalizado do usuário',
+                                                       chat_id_usuario=chat_id):
+                    raise Exception("falha ao salvar configuração")
                 
                 mensagem = f"✅ Horário de limpeza alterado para {horario_formatado}!\n\n"
                 mensagem += "📅 O novo horário foi aplicado ao seu perfil.\n"
@@ -382,46 +354,32 @@ Esta limpeza remove mensagens antigas da fila que não foram enviadas.
             logger.error(f"Erro ao definir horário de limpeza: {e}")
             self.bot.send_message(chat_id, f"❌ Erro ao alterar horário: {e}")
 
+    def _aplicar_horarios_usuario(self, chat_id):
+        """Move o usuário para os slots dos novos horários sem reiniciar o agendador"""
+        scheduler = getattr(self.bot, 'scheduler', None)
+        if scheduler and hasattr(scheduler, 'atualizar_horarios_usuario'):
+            scheduler.atualizar_horarios_usuario(chat_id)
+
     def recriar_jobs(self, chat_id):
-        """Recria todos os jobs do agendador com limpeza completa"""
+        """Confere os jobs contra os horários salvos e corrige as diferenças, sem parar o agendador"""
         try:
             if hasattr(self.bot, 'scheduler') and self.bot.scheduler:
-                # Parar scheduler completamente
-                if self.bot.scheduler.running:
-                    self.bot.scheduler.scheduler.shutdown(wait=True)
-                    self.bot.scheduler.running = False
-                
-                # Limpar todos os jobs existentes
-                jobs = self.bot.scheduler.scheduler.get_jobs()
-                for job in jobs:
-                    self.bot.scheduler.scheduler.remove_job(job.id)
-                
-                logger.info(f"Removidos {len(jobs)} jobs existentes")
-                
-                # Recriar scheduler do zero
-                from apscheduler.schedulers.background import BackgroundScheduler
-                import pytz
-                
-                self.bot.scheduler.scheduler = BackgroundScheduler(
-                    timezone=pytz.timezone('America/Sao_Paulo'),
-                    job_defaults={
-                        'coalesce': True,
-                        'max_instances': 1,
-                        'misfire_grace_time': 300
-                    }
-                )
-                
-                # Recriar jobs principais
-                self.bot.scheduler._setup_main_jobs()
-                
-                # Reiniciar scheduler
-                self.bot.scheduler.start()
+                resultado = self.bot.scheduler.recriar_jobs()
+                if resultado is None:
+                    raise Exception("falha ao reaplicar jobs")
                 
                 # Verificar jobs criados
                 jobs_criados = len(self.bot.scheduler.scheduler.get_jobs())
                 
-                mensagem = f"✅ Scheduler recriado com sucesso!\n"
-                mensagem += f"📊 {jobs_criados} jobs ativos"
+                if not resultado['lider']:
+                    self.bot.send_message(chat_id, "ℹ️ Os jobs rodam em outra instância (líder), "
+                                                   "que aplica as alterações em até um minuto.")
+                    return
+                
+                mensagem = f"✅ Jobs conferidos com sucesso!\n"
+                mensagem += f"📊 {jobs_criados} jobs ativos ({resultado['slots']} slots de horário)"
+                if resultado['adicionados'] or resultado['removidos']:
+                    mensagem += f"\n🔧 Corrigidos: +{len(resultado['adicionados'])} -{len(resultado['removidos'])}"
                 
             else:
                 mensagem = "❌ Agendador não disponível."
@@ -449,17 +407,9 @@ Esta limpeza remove mensagens antigas da fila que não foram enviadas.
                     # CRÍTICO: Isolamento por usuário - cada usuário tem suas próprias configurações
                     self.bot.db.salvar_configuracao(config_key, valor_padrao, chat_id_usuario=chat_id)
             
-            # Recriar jobs com os novos horários
-            if hasattr(self.bot, 'scheduler') and self.bot.scheduler:
-                # Parar scheduler atual
-                if self.bot.scheduler.running:
-                    self.bot.scheduler.scheduler.shutdown(wait=True)
-                    self.bot.scheduler.running = False
-                
-                # Reiniciar com configurações padrão
-                from scheduler_v2_simple import SimpleScheduler
-                self.bot.scheduler = SimpleScheduler(self.bot.db, self.bot)
-                logger.info(f"Jobs recriados com horários padrão para usuário {chat_id}")
+            # Aplicar os novos horários apenas aos slots deste usuário
+            self._aplicar_horarios_usuario(chat_id)
+            logger.info(f"Horários padrão aplicados para usuário {chat_id}")
             
             mensagem = f"""✅ SEUS HORÁRIOS FORAM RESETADOS!
 
@@ -520,14 +470,8 @@ Esta limpeza remove mensagens antigas da fila que não foram enviadas.
                 for job in jobs_para_remover:
                     self.bot.scheduler.scheduler.remove_job(job.id)
                 
-                # Garantir que temos apenas 3 jobs únicos
-                jobs_restantes = self.bot.scheduler.scheduler.get_jobs()
-                if len(jobs_restantes) != 3:
-                    # Recriar jobs do zero se não temos exatamente 3
-                    for job in jobs_restantes:
-                        self.bot.scheduler.scheduler.remove_job(job.id)
-                    
-                    self.bot.scheduler._setup_main_jobs()
+                # Slots de horário sem usuário saem, slots faltando voltam
+                self.bot.scheduler.reconciliar_jobs()
                 
                 jobs_final = len(self.bot.scheduler.scheduler.get_jobs())
                 mensagem = f"✅ Limpeza concluída!\n📊 Jobs ativos: {jobs_final}"
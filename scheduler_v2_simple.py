@@ -4,16 +4,55 @@ Versão final simplificada focada apenas no essencial
 """
 
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.base import STATE_RUNNING, STATE_PAUSED, STATE_STOPPED
 from utils import agora_br
 import pytz
-import requests
+from telegram_client import get_telegram_client
+from send_engine import SessionSendEngine
+from leader_election import LeaderElection
+from database import FILA_LOTE
 import os
 
 logger = logging.getLogger(__name__)
 
+# Horários usados quando o usuário personalizou apenas um dos dois
+HORARIO_VERIFICACAO_PADRAO = "09:00"
+HORARIO_ENVIO_PADRAO = "09:05"
+
+# Intervalo do job que devolve ao envio as mensagens com backoff vencido
+FILA_REENVIO_INTERVALO = int(os.getenv('FILA_REENVIO_INTERVALO', '60'))
+
+# Renovação periódica do lease das mensagens que aguardam a vez no motor de envio (bem abaixo de FILA_LEASE_SEGUNDOS)
+FILA_LEASE_RENOVACAO = int(os.getenv('FILA_LEASE_RENOVACAO', '120'))
+
+# Intervalo da conferência entre horários no banco e slots registrados
+JOBS_RECONCILIAR_INTERVALO = int(os.getenv('JOBS_RECONCILIAR_INTERVALO', '60'))
+
+# Execuções perdidas (deploy, queda) dentro desta janela são recuperadas ao iniciar
+JOBS_CATCHUP_GRACE_HORAS = float(os.getenv('JOBS_CATCHUP_GRACE_HORAS', '6'))
+# Atraso tolerado para um slot disparar quando o agendador estava ocupado
+JOBS_MISFIRE_GRACE = int(os.getenv('JOBS_MISFIRE_GRACE', '300'))
+
+# Antes de enviar, confere em lote se os números da fila têm WhatsApp e descarta os que não têm
+FILA_PREVALIDAR_NUMEROS = os.getenv('FILA_PREVALIDAR_NUMEROS', 'true').lower() == 'true'
+
+# Envios simultâneos do alerta diário (os limites da Bot API são aplicados pelo cliente do Telegram)
+NOTIFICACOES_WORKERS = int(os.getenv('NOTIFICACOES_WORKERS', '8'))
+
+# Com várias réplicas, apenas a que detém o advisory lock executa os jobs
+SCHEDULER_LEADER_ELECTION = os.getenv('SCHEDULER_LEADER_ELECTION', 'true').lower() == 'true'
+
+TIMEZONE_AGENDADOR = pytz.timezone('America/Sao_Paulo')
+TAREFA_VERIFICACAO = 'verificacao'
+TAREFA_ENVIO = 'envio'
+
 class SimpleScheduler:
     def __init__(self, database_manager, baileys_api, template_manager):
         """Inicializa agendador super simplificado"""
@@ -22,102 +61,323 @@ class SimpleScheduler:
         self.template_manager = template_manager
         self.bot_instance = None
         
-        self.scheduler = BackgroundScheduler(timezone=pytz.timezone('America/Sao_Paulo'))
+        self.scheduler = BackgroundScheduler(timezone=TIMEZONE_AGENDADOR)
         self.running = False
         
+        # Eleição entre réplicas: só a líder executa os jobs (criada em start)
+        self.leader = None
+        
+        # Slots HH:MM -> usuários que os usam; protege alterações incrementais dos jobs
+        self._slots_lock = threading.RLock()
+        self._horarios = {}
+        
+        # Envios WhatsApp: sessões em paralelo, intervalo anti-ban por sessão; o motor é o da
+        # BaileysAPI, então o intervalo vale também para envios feitos fora do agendador
+        self.send_engine = baileys_api.send_engine if baileys_api else SessionSendEngine()
+        
+        # Mensagens reivindicadas que este processo tem no motor de envio ({id: tentativas});
+        # o lease delas é renovado em segundo plano e elas ficam fora de novas reivindicações
+        self._retidas = {}
+        self._retidas_lock = threading.Lock()
+        self._parar_renovacao = threading.Event()
+        self._renovacao_thread = None
+        
     def start(self):
-        """Inicia o agendador com horários personalizados por usuário"""
+        """Inicia o agendador; com eleição de líder, os jobs só rodam na réplica líder"""
         try:
             if not self.running:
-                # Configurar jobs personalizados para cada usuário
-                self._configurar_jobs_personalizados()
-                
-                self.scheduler.start()
+                self.send_engine.start()
+                self._iniciar_renovacao_leases()
                 self.running = True
-                logger.info(f"✅ Agendador iniciado com horários personalizados")
+                if SCHEDULER_LEADER_ELECTION:
+                    if self.leader is None:
+                        self.leader = LeaderElection(self.db.conexao_dedicada,
+                                                     on_elected=self._assumir_lideranca,
+                                                     on_revoked=self._deixar_lideranca)
+                    self.leader.start()
+                    logger.info("✅ Agendador aguardando liderança")
+                else:
+                    self._assumir_lideranca()
                 
         except Exception as e:
             logger.error(f"Erro ao iniciar agendador: {e}")
     
+    def _assumir_lideranca(self):
+        """Configura os jobs e passa a executá-los (esta réplica é a líder)"""
+        # Configurar jobs personalizados para cada usuário
+        self._configurar_jobs_personalizados()
+        self._configurar_job_reenvio()
+        self._configurar_job_reconciliacao()
+        self._agendar_recuperacao()
+        
+        if self.scheduler.state == STATE_PAUSED:
+            self.scheduler.resume()
+        elif self.scheduler.state == STATE_STOPPED:
+            self.scheduler.start()
+        logger.info(f"✅ Agendador iniciado com horários personalizados")
+    
+    def _deixar_lideranca(self):
+        """Suspende os jobs para que só a nova líder os execute"""
+        if self.scheduler.state == STATE_RUNNING:
+            self.scheduler.pause()
+        self.scheduler.remove_all_jobs()
+        with self._slots_lock:
+            self._horarios = {}
+        logger.info("Agendador em espera (outra réplica é a líder)")
+    
+    @property
+    def is_leader(self):
+        """Indica se esta réplica executa os jobs agendados"""
+        return self.running and (self.leader.is_leader if self.leader else True)
+    
     def stop(self):
         """Para o agendador"""
         try:
             if self.running:
-                self.scheduler.shutdown()
+                if self.leader:
+                    self.leader.stop()
+                if self.scheduler.state != STATE_STOPPED:
+                    self.scheduler.shutdown()
+                self._parar_renovacao.set()
+                self.send_engine.stop()
                 self.running = False
                 logger.info("Agendador parado")
         except Exception as e:
             logger.error(f"Erro ao parar agendador: {e}")
     
     def _configurar_jobs_personalizados(self):
-        """Configura jobs personalizados para cada usuário"""
+        """Registra um job por minuto do dia em uso (no máximo 1.440), não dois por usuário"""
         try:
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    # Buscar todos os usuários com horários personalizados
-                    cursor.execute("""
-                        SELECT DISTINCT chat_id_usuario 
-                        FROM configuracoes 
-                        WHERE chat_id_usuario IS NOT NULL 
-                        AND chave IN ('horario_verificacao_diaria', 'horario_envio_diario')
-                    """)
-                    usuarios = cursor.fetchall()
-                    
-                    for usuario in usuarios:
-                        chat_id = usuario[0]
-                        self._configurar_jobs_usuario(chat_id)
+            resultado = self.reconciliar_jobs(avisar=True)
+            logger.info(f"✅ {resultado['slots']} slot(s) de horário configurados para "
+                        f"{resultado['usuarios']} usuário(s)")
                         
         except Exception as e:
             logger.error(f"Erro ao configurar jobs personalizados: {e}")
             # Fallback para job global padrão
             self._configurar_job_global()
     
-    def _configurar_jobs_usuario(self, chat_id):
-        """Configura jobs específicos para um usuário"""
+    def atualizar_horarios_usuario(self, chat_id):
+        """Aplica os horários atuais do usuário aos slots sem parar o agendador
+
+        O slot novo é registrado antes de o antigo ser descartado, então o usuário
+        nunca fica sem job; os demais usuários não são afetados. Em réplica que
+        não é a líder não há jobs: a líder aplica a mudança na próxima reconciliação.
+        """
+        if not self.is_leader:
+            return True
+        try:
+            atuais = self._horarios_usuarios(chat_id=chat_id).get(chat_id)
+            
+            with self._slots_lock:
+                anteriores = self._horarios.pop(chat_id, ())
+                if atuais:
+                    self._horarios[chat_id] = atuais
+                    for horario in set(atuais):
+                        if not self.scheduler.get_job(f'slot_{horario}'):
+                            self._registrar_slot(horario)
+                em_uso = self._slots_em_uso()
+                for horario in set(anteriores) - em_uso:
+                    self._remover_slot(horario)
+            
+            if atuais:
+                logger.info(f"✅ Horários do usuário {chat_id} aplicados: Verif {atuais[0]}, Envio {atuais[1]}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao atualizar horários do usuário {chat_id}: {e}")
+            return False
+    
+    def reconciliar_jobs(self, avisar=False):
+        """Confere os slots vivos contra as configurações no banco e corrige as diferenças"""
+        if not self.is_leader:
+            return {'lider': False, 'usuarios': 0, 'slots': 0, 'adicionados': [], 'removidos': []}
+        with self._slots_lock:
+            self._horarios = self._horarios_usuarios(avisar=avisar)
+            esperados = self._slots_em_uso()
+            vivos = {job.id[len('slot_'):] for job in self.scheduler.get_jobs() if job.id.startswith('slot_')}
+            
+            adicionados = sorted(esperados - vivos)
+            removidos = sorted(vivos - esperados)
+            for horario in adicionados:
+                self._registrar_slot(horario)
+            for horario in removidos:
+                self._remover_slot(horario)
+        
+        # Na primeira configuração não há slots vivos e tudo é adicionado
+        if vivos and (adicionados or removidos):
+            logger.warning(f"⚠️ Jobs reconciliados: +{adicionados} -{removidos}")
+        return {
+            'lider': True,
+            'usuarios': len(self._horarios),
+            'slots': len(esperados),
+            'adicionados': adicionados,
+            'removidos': removidos
+        }
+    
+    def _slots_em_uso(self):
+        return {horario for par in self._horarios.values() for horario in par}
+    
+    def _remover_slot(self, horario):
+        try:
+            self.scheduler.remove_job(f'slot_{horario}')
+        except JobLookupError:
+            pass
+    
+    def _configurar_job_reconciliacao(self):
+        """Job periódico que pega alterações de horário feitas por outros processos ou direto no banco"""
         try:
-            # Buscar horários personalizados do usuário
-            horario_verificacao = "09:00"
-            horario_envio = "09:05"
-            
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT chave, valor FROM configuracoes 
-                        WHERE chat_id_usuario = %s 
-                        AND chave IN ('horario_verificacao_diaria', 'horario_envio_diario')
-                    """, (chat_id,))
-                    
-                    configs = cursor.fetchall()
-                    for config in configs:
-                        if config[0] == 'horario_verificacao_diaria':
-                            horario_verificacao = config[1]
-                        elif config[0] == 'horario_envio_diario':
-                            horario_envio = config[1]
-            
-            # Job de verificação para este usuário
-            hora_verif, min_verif = map(int, horario_verificacao.split(':'))
             self.scheduler.add_job(
-                func=lambda: self._verificar_usuario_especifico(chat_id),
-                trigger=CronTrigger(hour=hora_verif, minute=min_verif),
-                id=f'verificacao_usuario_{chat_id}',
-                name=f'Verificação {chat_id} - {horario_verificacao}',
-                replace_existing=True
+                func=self._reconciliar_periodico,
+                trigger=IntervalTrigger(seconds=JOBS_RECONCILIAR_INTERVALO),
+                id='reconciliar_jobs',
+                name=f'Reconciliação de jobs a cada {JOBS_RECONCILIAR_INTERVALO}s',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
             )
-            
-            # Job de envio para este usuário
-            hora_envio, min_envio = map(int, horario_envio.split(':'))
+        except Exception as e:
+            logger.error(f"Erro ao configurar job de reconciliação: {e}")
+    
+    def _reconciliar_periodico(self):
+        try:
+            self.reconciliar_jobs()
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar jobs: {e}")
+    
+    @staticmethod
+    def _normalizar_horario(valor):
+        """Converte 'H:M' em 'HH:MM' (None se inválido)"""
+        try:
+            hora, minuto = map(int, str(valor).strip().split(':')[:2])
+        except (TypeError, ValueError):
+            return None
+        if 0 <= hora < 24 and 0 <= minuto < 60:
+            return f"{hora:02d}:{minuto:02d}"
+        return None
+    
+    def _horarios_usuarios(self, avisar=False, chat_id=None):
+        """{chat_id: (horario_verificacao, horario_envio)} de todos os usuários (ou de um), em uma consulta"""
+        horarios = {}
+        for linha in self.db.obter_horarios_usuarios(HORARIO_VERIFICACAO_PADRAO, HORARIO_ENVIO_PADRAO, chat_id):
+            verificacao = self._normalizar_horario(linha['horario_verificacao'])
+            envio = self._normalizar_horario(linha['horario_envio'])
+            if avisar and (not verificacao or not envio):
+                logger.warning(f"⚠️ Horário inválido para usuário {linha['chat_id_usuario']}: "
+                               f"{linha['horario_verificacao']} / {linha['horario_envio']}")
+            horarios[linha['chat_id_usuario']] = (verificacao or HORARIO_VERIFICACAO_PADRAO,
+                                                  envio or HORARIO_ENVIO_PADRAO)
+        return horarios
+    
+    def _registrar_slot(self, horario):
+        """Job diário do slot HH:MM, compartilhado por todos os usuários com esse horário"""
+        hora, minuto = map(int, horario.split(':'))
+        self.scheduler.add_job(
+            func=self._executar_slot,
+            args=[horario],
+            trigger=CronTrigger(hour=hora, minute=minuto),
+            id=f'slot_{horario}',
+            name=f'Verificação/Envio {horario}',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=JOBS_MISFIRE_GRACE
+        )
+    
+    def _executar_slot(self, horario):
+        """Verifica e envia, em lote, para todos os usuários cujo horário é este slot"""
+        try:
+            horarios = self._horarios_usuarios()
+            verificar = [(chat_id, horario) for chat_id, (verificacao, _) in horarios.items() if verificacao == horario]
+            enviar = [(chat_id, horario) for chat_id, (_, envio) in horarios.items() if envio == horario]
+            logger.info(f"⏰ Slot {horario}: {len(verificar)} verificação(ões), {len(enviar)} envio(s)")
+            # Slot das 23:59 que dispara após a meia-noite (misfire) ainda verifica o dia dele
+            self._executar_tarefas(verificar, enviar, self._ultima_ocorrencia(horario, self._agora()).date())
+        except Exception as e:
+            logger.error(f"Erro ao executar slot {horario}: {e}")
+    
+    def _executar_tarefas(self, verificar, enviar, data_referencia=None):
+        """Executa verificação e envio para listas de (chat_id, horario) e grava a conclusão no banco
+
+        data_referencia é o dia da ocorrência verificada (padrão: hoje).
+        """
+        inicio = self._agora()
+        # Verificação antes do envio para que o mesmo slot já envie o que acabou de enfileirar
+        if verificar and self._verificar_vencimentos([chat_id for chat_id, _ in verificar],
+                                                     data_referencia) is not None:
+            self._registrar_execucoes(TAREFA_VERIFICACAO, verificar, inicio)
+        if enviar and self._processar_envios_usuarios([chat_id for chat_id, _ in enviar]) is not None:
+            self._registrar_execucoes(TAREFA_ENVIO, enviar, inicio)
+    
+    def _registrar_execucoes(self, tarefa, execucoes, quando):
+        try:
+            self.db.registrar_execucoes_agendadas(tarefa, execucoes, quando)
+        except Exception as e:
+            logger.error(f"Erro ao registrar execuções de {tarefa}: {e}")
+    
+    @staticmethod
+    def _agora():
+        """Horário local do agendador, sem fuso, como gravado em execucoes_agendadas"""
+        return datetime.now(TIMEZONE_AGENDADOR).replace(tzinfo=None)
+    
+    @staticmethod
+    def _ultima_ocorrencia(horario, agora):
+        """Último instante HH:MM já alcançado (hoje ou ontem)"""
+        hora, minuto = map(int, horario.split(':'))
+        ocorrencia = agora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+        if ocorrencia > agora:
+            ocorrencia -= timedelta(days=1)
+        return ocorrencia
+    
+    def _agendar_recuperacao(self):
+        """Agenda a recuperação de execuções perdidas para logo após a partida"""
+        try:
             self.scheduler.add_job(
-                func=lambda: self._processar_envios_usuario(chat_id),
-                trigger=CronTrigger(hour=hora_envio, minute=min_envio),
-                id=f'envio_usuario_{chat_id}',
-                name=f'Envio {chat_id} - {horario_envio}',
+                func=self._recuperar_execucoes_perdidas,
+                id='recuperar_execucoes',
+                name='Recuperação de execuções perdidas',
                 replace_existing=True
             )
+        except Exception as e:
+            logger.error(f"Erro ao agendar recuperação de execuções: {e}")
+    
+    def _recuperar_execucoes_perdidas(self):
+        """Executa as verificações e envios cujo horário passou sem conclusão registrada
+
+        Só considera ocorrências dentro de JOBS_CATCHUP_GRACE_HORAS; as duas tarefas são
+        idempotentes (cobrança deduplicada por dia, envio por reivindicação), então
+        repetir uma execução que não chegou a ser registrada é seguro.
+        """
+        try:
+            agora = self._agora()
+            tolerancia = timedelta(hours=JOBS_CATCHUP_GRACE_HORAS)
+            ultimas = self.db.obter_execucoes_agendadas()
+            
+            # Verificações agrupadas pelo dia da ocorrência: a de ontem cobra os vencidos daquela janela
+            verificar, enviar = {}, []
+            for chat_id, (verificacao, envio) in self._horarios_usuarios().items():
+                for tarefa, horario in ((TAREFA_VERIFICACAO, verificacao), (TAREFA_ENVIO, envio)):
+                    ocorrencia = self._ultima_ocorrencia(horario, agora)
+                    if agora - ocorrencia > tolerancia:
+                        continue
+                    ultima = ultimas.get((chat_id, tarefa))
+                    if ultima is None or ultima < ocorrencia:
+                        if tarefa == TAREFA_VERIFICACAO:
+                            verificar.setdefault(ocorrencia.date(), []).append((chat_id, horario))
+                        else:
+                            enviar.append((chat_id, horario))
+            
+            total_verificar = sum(len(pendentes) for pendentes in verificar.values())
+            if not total_verificar and not enviar:
+                logger.info("✅ Nenhuma execução perdida a recuperar")
+                return
             
-            logger.info(f"✅ Jobs configurados para usuário {chat_id}: Verif {horario_verificacao}, Envio {horario_envio}")
-            
+            logger.warning(f"⚠️ Recuperando execuções perdidas: {total_verificar} verificação(ões), "
+                           f"{len(enviar)} envio(s)")
+            for data_referencia, pendentes in sorted(verificar.items()):
+                self._executar_tarefas(pendentes, [], data_referencia)
+            self._executar_tarefas([], enviar)
         except Exception as e:
-            logger.error(f"Erro ao configurar jobs para usuário {chat_id}: {e}")
+            logger.error(f"Erro ao recuperar execuções perdidas: {e}")
     
     def _configurar_job_global(self):
         """Configura job global padrão como fallback"""
@@ -133,116 +393,214 @@ class SimpleScheduler:
         except Exception as e:
             logger.error(f"Erro ao configurar job global: {e}")
     
+    def _configurar_job_reenvio(self):
+        """Job periódico que reenvia mensagens cujo backoff já venceu"""
+        try:
+            self.scheduler.add_job(
+                func=self._processar_reenvios,
+                trigger=IntervalTrigger(seconds=FILA_REENVIO_INTERVALO),
+                id='reenvio_fila',
+                name=f'Reenvio da fila a cada {FILA_REENVIO_INTERVALO}s',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        except Exception as e:
+            logger.error(f"Erro ao configurar job de reenvio: {e}")
+    
     def _verificar_usuario_especifico(self, chat_id):
         """Verifica vencimentos para um usuário específico"""
+        self._verificar_vencimentos([chat_id])
+    
+    def _verificar_vencimentos(self, chat_ids=None, data_referencia=None):
+        """Enfileira cobranças de clientes vencidos há 1 dia em uma única ida ao banco
+
+        chat_ids=None verifica todos os usuários; data_referencia é o dia da
+        verificação (padrão: hoje). Retorna None em caso de erro.
+        """
         try:
-            logger.info(f"🔍 Verificando vencimentos para usuário {chat_id}")
+            if chat_ids is None:
+                alvo = 'todos os usuários'
+            elif len(chat_ids) <= 10:
+                alvo = f"usuário(s) {', '.join(map(str, chat_ids))}"
+            else:
+                alvo = f"{len(chat_ids)} usuários"
+            logger.info(f"🔍 Verificando vencimentos para {alvo}")
             
-            # Buscar clientes vencidos há exatamente 1 dia
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT id, nome, telefone, vencimento, valor 
-                        FROM clientes 
-                        WHERE chat_id_usuario = %s
-                        AND vencimento = CURRENT_DATE - INTERVAL '1 day'
-                        AND receber_cobranca = true
-                        AND ativo = true
-                    """, (chat_id,))
-                    
-                    clientes_vencidos = cursor.fetchall()
-                    
-                    if clientes_vencidos:
-                        logger.info(f"📋 {len(clientes_vencidos)} cliente(s) vencido(s) há 1 dia para usuário {chat_id}")
-                        
-                        # Adicionar à fila de mensagens
-                        for cliente in clientes_vencidos:
-                            self._adicionar_mensagem_fila(chat_id, cliente)
-                    else:
-                        logger.info(f"✅ Nenhum cliente vencido há 1 dia para usuário {chat_id}")
+            enfileiradas = self.db.enfileirar_cobrancas_vencidas(chat_ids, data_referencia=data_referencia)
+            
+            if enfileiradas:
+                for chat_id, total in enfileiradas.items():
+                    logger.info(f"📋 {total} cobrança(s) adicionada(s) à fila para usuário {chat_id}")
+            else:
+                logger.info(f"✅ Nenhum cliente vencido há 1 dia para {alvo}")
+            return enfileiradas
                         
         except Exception as e:
-            logger.error(f"Erro ao verificar usuário {chat_id}: {e}")
+            logger.error(f"Erro ao verificar vencimentos: {e}")
+            return None
     
     def _processar_envios_usuario(self, chat_id):
-        """Processa envios de mensagens para um usuário específico"""
+        """Reivindica as mensagens vencidas do usuário e entrega ao motor de envio"""
+        return self._processar_envios_usuarios([chat_id])
+    
+    def _processar_envios_usuarios(self, chat_ids):
+        """Reivindica as mensagens vencidas dos usuários informados e entrega ao motor de envio"""
         try:
-            logger.info(f"📤 Processando envios para usuário {chat_id}")
-            
-            # Buscar mensagens pendentes na fila
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT id, cliente_id, template_id, variaveis, telefone_destino
-                        FROM fila_mensagens 
-                        WHERE chat_id_usuario = %s
-                        AND status = 'pendente'
-                        AND data_agendamento <= CURRENT_DATE
-                    """, (chat_id,))
-                    
-                    mensagens = cursor.fetchall()
-                    
-                    if mensagens:
-                        logger.info(f"📨 {len(mensagens)} mensagem(ns) para enviar para usuário {chat_id}")
-                        
-                        for mensagem in mensagens:
-                            self._enviar_mensagem_fila(mensagem, chat_id)
-                    else:
-                        logger.info(f"✅ Nenhuma mensagem pendente para usuário {chat_id}")
+            alvo = chat_ids[0] if len(chat_ids) == 1 else f"{len(chat_ids)} usuários"
+            logger.info(f"📤 Processando envios para {alvo}")
+            self._prevalidar_numeros(chat_ids)
+            
+            enfileiradas = 0
+            while True:
+                mensagens = self.db.reivindicar_mensagens_fila(chat_ids_usuarios=chat_ids, limit=FILA_LOTE,
+                                                               excluir_ids=self._ids_retidos())
+                enfileiradas += self.enfileirar_envios(mensagens)
+                if len(mensagens) < FILA_LOTE:
+                    break
+            
+            if enfileiradas:
+                logger.info(f"📨 {enfileiradas} mensagem(ns) em envio para {alvo}")
+            else:
+                logger.info(f"✅ Nenhuma mensagem pendente para {alvo}")
+            return enfileiradas
                         
         except Exception as e:
-            logger.error(f"Erro ao processar envios para usuário {chat_id}: {e}")
+            logger.error(f"Erro ao processar envios para {chat_ids}: {e}")
+            return None
     
-    def _adicionar_mensagem_fila(self, chat_id, cliente):
-        """Adiciona mensagem de cobrança à fila"""
+    def _processar_reenvios(self):
+        """Reivindica apenas mensagens em backoff cujo horário de nova tentativa chegou"""
         try:
-            cliente_id, nome, telefone, vencimento, valor = cliente
-            
-            # Buscar template de cobrança do usuário
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT id FROM templates 
-                        WHERE chat_id_usuario = %s 
-                        AND tipo = 'cobranca'
-                        AND ativo = true
-                        ORDER BY id DESC LIMIT 1
-                    """, (chat_id,))
-                    
-                    template = cursor.fetchone()
-                    if not template:
-                        logger.warning(f"⚠️ Nenhum template de cobrança encontrado para usuário {chat_id}")
-                        return
-                    
-                    template_id = template[0]
-                    
-                    # Inserir na fila
-                    cursor.execute("""
-                        INSERT INTO fila_mensagens 
-                        (chat_id_usuario, cliente_id, template_id, telefone_destino, 
-                         variaveis, data_agendamento, status) 
-                        VALUES (%s, %s, %s, %s, %s, CURRENT_DATE, 'pendente')
-                    """, (chat_id, cliente_id, template_id, telefone, 
-                          f'{{"nome": "{nome}", "valor": "{valor}", "vencimento": "{vencimento}"}}'))
-                    
-                    logger.info(f"✅ Mensagem adicionada à fila: {nome} ({telefone})")
-                    
+            enfileiradas = 0
+            while True:
+                mensagens = self.db.reivindicar_mensagens_fila(limit=FILA_LOTE, somente_reenvios=True,
+                                                               excluir_ids=self._ids_retidos())
+                enfileiradas += self.enfileirar_envios(mensagens)
+                if len(mensagens) < FILA_LOTE:
+                    break
+            if enfileiradas:
+                logger.info(f"🔁 {enfileiradas} mensagem(ns) reenviadas após backoff")
+            return enfileiradas
+        except Exception as e:
+            logger.error(f"Erro ao processar reenvios da fila: {e}")
+            return 0
+    
+    def _processar_fila_mensagens(self):
+        """Reivindica as mensagens vencidas de todos os usuários e entrega ao motor de envio"""
+        try:
+            self._prevalidar_numeros()
+            enfileiradas = 0
+            while True:
+                mensagens = self.db.reivindicar_mensagens_fila(limit=FILA_LOTE, excluir_ids=self._ids_retidos())
+                enfileiradas += self.enfileirar_envios(mensagens)
+                if len(mensagens) < FILA_LOTE:
+                    break
+            logger.info(f"📨 Fila processada: {enfileiradas} mensagem(ns) em envio")
+            return enfileiradas
+        except Exception as e:
+            logger.error(f"Erro ao processar fila de mensagens: {e}")
+            return 0
+    
+    def _prevalidar_numeros(self, chat_ids=None):
+        """Verifica de uma vez os números da fila vencida e descarta as mensagens para números sem WhatsApp"""
+        if not FILA_PREVALIDAR_NUMEROS:
+            return 0
+        try:
+            por_usuario = {}
+            for destino in self.db.obter_destinos_fila(chat_ids):
+                por_usuario.setdefault(destino['chat_id_usuario'], []).append(destino)
+            
+            invalidos = []
+            sem_whatsapp = []
+            for chat_id, destinos in por_usuario.items():
+                # Números sem verificação (sessão desconectada, erro) seguem para envio normalmente
+                verificacoes = self.baileys_api.check_numbers({d['telefone_destino'] for d in destinos}, chat_id)
+                for destino in destinos:
+                    verificacao = verificacoes.get(destino['telefone_destino'])
+                    if verificacao is None or verificacao['registered']:
+                        continue
+                    (sem_whatsapp if verificacao['number'] else invalidos).append(destino['id'])
+            
+            descartadas = self.db.descartar_mensagens_fila(invalidos, 'Número de telefone inválido')
+            descartadas += self.db.descartar_mensagens_fila(sem_whatsapp, 'Número não registrado no WhatsApp')
+            if descartadas:
+                logger.info(f"📵 {descartadas} mensagem(ns) descartada(s) antes do envio: número sem WhatsApp ou inválido")
+            return descartadas
         except Exception as e:
-            logger.error(f"Erro ao adicionar mensagem à fila: {e}")
+            logger.error(f"Erro na pré-validação de números da fila: {e}")
+            return 0
+    
+    def enfileirar_envios(self, mensagens, chat_id=None):
+        """Agenda mensagens já reivindicadas no motor de envio, na sessão WhatsApp do dono de cada uma"""
+        self.send_engine.start()
+        enfileiradas = 0
+        for mensagem in mensagens:
+            dono = chat_id if chat_id is not None else mensagem['chat_id_usuario']
+            sessao = self.baileys_api.get_user_session(dono)
+            # Registrada antes do submit: o envio pode terminar antes de submit retornar
+            with self._retidas_lock:
+                if mensagem['id'] in self._retidas:
+                    continue
+                self._retidas[mensagem['id']] = mensagem['tentativas']
+            if self.send_engine.submit(sessao, mensagem['id'], self._enviar_mensagem_fila, mensagem, dono):
+                enfileiradas += 1
+            else:
+                self._soltar_retida(mensagem)
+        return enfileiradas
+    
+    def _ids_retidos(self):
+        with self._retidas_lock:
+            return list(self._retidas)
     
-    def _enviar_mensagem_fila(self, mensagem_data, chat_id):
-        """Envia mensagem da fila via WhatsApp"""
+    def _soltar_retida(self, mensagem_data):
+        with self._retidas_lock:
+            if self._retidas.get(mensagem_data.get('id')) == mensagem_data.get('tentativas'):
+                del self._retidas[mensagem_data['id']]
+    
+    def _iniciar_renovacao_leases(self):
+        """Thread que mantém vivo o lease das mensagens retidas (roda em todas as réplicas, não só na líder)"""
+        if self._renovacao_thread and self._renovacao_thread.is_alive():
+            return
+        self._parar_renovacao.clear()
+        self._renovacao_thread = threading.Thread(target=self._renovar_leases_loop,
+                                                  name="fila-lease", daemon=True)
+        self._renovacao_thread.start()
+    
+    def _renovar_leases_loop(self):
+        while not self._parar_renovacao.wait(FILA_LEASE_RENOVACAO):
+            with self._retidas_lock:
+                retidas = dict(self._retidas)
+            if retidas:
+                renovadas = self.db.renovar_leases_mensagens_fila(retidas)
+                logger.debug(f"Lease renovado para {renovadas}/{len(retidas)} mensagem(ns) aguardando envio")
+    
+    def _enviar_mensagem_fila(self, mensagem_data, chat_id=None):
+        """Envia mensagem reivindicada da fila via WhatsApp e encerra a reivindicação; retorna True se enviada"""
         try:
-            fila_id, cliente_id, template_id, variaveis, telefone = mensagem_data
+            fila_id = mensagem_data['id']
+            tentativas = mensagem_data['tentativas']
+            telefone = mensagem_data['telefone_destino']
+            template_id = mensagem_data.get('template_id')
+            if chat_id is None:
+                chat_id = mensagem_data.get('chat_id_usuario')
+            
+            # O lease pode ter expirado enquanto a mensagem aguardava a vez da sessão
+            if not self.db.renovar_lease_mensagem_fila(fila_id, tentativas):
+                logger.warning(f"⚠️ Mensagem {fila_id} reivindicada por outro processo, envio ignorado")
+                return False
             
-            # Buscar template
-            template_content = self.template_manager.buscar_template_por_id(template_id)
+            # Conteúdo do template, ou o texto já gravado na fila
+            template = self.template_manager.buscar_template_por_id(template_id) if template_id else None
+            template_content = template.get('conteudo') if template else mensagem_data.get('mensagem')
             if not template_content:
                 logger.error(f"❌ Template {template_id} não encontrado")
-                return
+                self.db.concluir_mensagem_fila(fila_id, tentativas, False, 'Template não encontrado', definitivo=True)
+                return False
             
             # Processar variáveis
             import json
+            variaveis = mensagem_data.get('variaveis')
             vars_dict = json.loads(variaveis) if variaveis else {}
             
             # Substituir variáveis no template
@@ -250,33 +608,27 @@ class SimpleScheduler:
             for var, valor in vars_dict.items():
                 mensagem_final = mensagem_final.replace(f'{{{var}}}', str(valor))
             
-            # Enviar via Baileys
-            result = self.baileys_api.send_message(
-                phone_number=telefone,
-                message=mensagem_final,
-                session_id=f"user_{chat_id}"
-            )
+            # Enviar via Baileys (o intervalo entre envios da sessão fica com o motor de envio)
+            result = self.baileys_api.send_message(telefone, mensagem_final, chat_id)
             
             # Atualizar status na fila
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    if result.get('success'):
-                        cursor.execute("""
-                            UPDATE fila_mensagens 
-                            SET status = 'enviada', data_envio = NOW()
-                            WHERE id = %s
-                        """, (fila_id,))
-                        logger.info(f"✅ Mensagem enviada com sucesso: {telefone}")
-                    else:
-                        cursor.execute("""
-                            UPDATE fila_mensagens 
-                            SET status = 'erro', observacoes = %s
-                            WHERE id = %s
-                        """, (result.get('error', 'Erro desconhecido'), fila_id))
-                        logger.error(f"❌ Erro ao enviar mensagem: {telefone}")
+            if result.get('success'):
+                self.db.concluir_mensagem_fila(fila_id, tentativas, True)
+                logger.info(f"✅ Mensagem enviada com sucesso: {telefone}")
+                return True
+            
+            # Falhas de conexão são reagendadas com backoff; número inválido não adianta repetir
+            erro = result.get('error', 'Erro desconhecido')
+            self.db.concluir_mensagem_fila(fila_id, tentativas, False, erro,
+                                           definitivo=erro == 'Número de telefone inválido')
+            logger.error(f"❌ Erro ao enviar mensagem: {telefone} ({erro})")
+            return False
                         
         except Exception as e:
             logger.error(f"Erro ao enviar mensagem da fila: {e}")
+            return False
+        finally:
+            self._soltar_retida(mensagem_data)
     
     def _buscar_horario_verificacao_legacy(self):
         """Método legacy mantido para compatibilidade"""
@@ -300,151 +652,99 @@ class SimpleScheduler:
             return "09:05"  # Padrão em caso de erro
     
     def recriar_jobs(self, novo_horario_verificacao=None):
-        """Recria os jobs com novos horários"""
+        """Reaplica os jobs sem parar o agendador; retorna o resultado da reconciliação (None em erro)"""
         try:
-            # Parar scheduler atual
-            if self.running:
-                self.scheduler.shutdown()
-                self.running = False
-                logger.info("Scheduler parado para recriar jobs")
-            
-            # Criar novo scheduler
-            self.scheduler = BackgroundScheduler(timezone=pytz.timezone('America/Sao_Paulo'))
+            if not self.running:
+                self.start()
+            if not self.is_leader:
+                return self.reconciliar_jobs()
             
-            # Buscar horário (usar novo se fornecido)
             if novo_horario_verificacao:
-                horario = novo_horario_verificacao
-            else:
-                horario = self._buscar_horario_verificacao()
-                
-            hora, minuto = map(int, horario.split(':'))
-            
-            # Recriar job
-            self.scheduler.add_job(
-                func=self._notificar_usuarios_diario,
-                trigger=CronTrigger(hour=hora, minute=minuto),
-                id='notificar_usuarios',
-                name=f'Notificações Diárias {horario}',
-                replace_existing=True
-            )
-            
-            # Reiniciar
-            self.scheduler.start()
-            self.running = True
-            logger.info(f"✅ Jobs recriados: Notificações {horario}")
-            return True
+                hora, minuto = map(int, novo_horario_verificacao.split(':'))
+                # replace_existing troca o gatilho no lugar, sem janela sem job
+                self.scheduler.add_job(
+                    func=self._notificar_usuarios_diario,
+                    trigger=CronTrigger(hour=hora, minute=minuto),
+                    id='notificar_usuarios',
+                    name=f'Notificações Diárias {novo_horario_verificacao}',
+                    replace_existing=True
+                )
+            
+            self._configurar_job_reenvio()
+            self._configurar_job_reconciliacao()
+            resultado = self.reconciliar_jobs()
+            
+            logger.info(f"✅ Jobs reaplicados: {resultado['slots']} slot(s), "
+                        f"+{len(resultado['adicionados'])} -{len(resultado['removidos'])}")
+            return resultado
             
         except Exception as e:
             logger.error(f"Erro ao recriar jobs: {e}")
-            return False
+            return None
     
     def _notificar_usuarios_diario(self):
-        """Notifica cada usuário sobre seus clientes vencendo"""
+        """Notifica cada usuário sobre seus clientes vencendo: uma consulta agrupada e envios em paralelo"""
         try:
             logger.info("=== NOTIFICAÇÕES DIÁRIAS INICIADAS ===")
             hoje = agora_br().date()
             
-            # Buscar todos os usuários do sistema
-            usuarios = self._buscar_usuarios_sistema()
-            logger.info(f"Encontrados {len(usuarios)} usuários para notificar")
-            
-            for usuario in usuarios:
-                try:
-                    chat_id = usuario['chat_id']
-                    self._enviar_notificacao_usuario(chat_id, hoje)
-                except Exception as e:
-                    logger.error(f"Erro ao notificar usuário {usuario.get('chat_id', 'desconhecido')}: {e}")
+            resumos = self.db.resumo_vencimentos_usuarios(hoje)
+            logger.info(f"Encontrados {len(resumos)} usuários com vencimentos para notificar")
+            
+            # Os limites de envio (global e por chat) ficam no cliente do Telegram;
+            # o pool apenas sobrepõe a espera de rede dos envios
+            enviados = 0
+            with ThreadPoolExecutor(max_workers=NOTIFICACOES_WORKERS, thread_name_prefix='alerta-diario') as executor:
+                futuros = {
+                    executor.submit(self._enviar_telegram, resumo['chat_id_usuario'],
+                                    self._montar_alerta_diario(resumo, hoje)): resumo['chat_id_usuario']
+                    for resumo in resumos
+                }
+                for futuro in as_completed(futuros):
+                    if futuro.result():
+                        enviados += 1
+                    else:
+                        logger.error(f"Falha ao enviar notificação para usuário {futuros[futuro]}")
             
-            logger.info("=== NOTIFICAÇÕES CONCLUÍDAS ===")
+            logger.info(f"=== NOTIFICAÇÕES CONCLUÍDAS: {enviados}/{len(resumos)} enviadas ===")
             
         except Exception as e:
             logger.error(f"Erro nas notificações diárias: {e}")
     
-    def _buscar_usuarios_sistema(self):
-        """Busca usuários ativos do sistema"""
-        try:
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT DISTINCT chat_id 
-                        FROM usuarios 
-                        WHERE status IN ('ativo', 'teste')
-                    """)
-                    resultados = cursor.fetchall()
-                    return [{'chat_id': row[0]} for row in resultados]
-        except Exception as e:
-            logger.error(f"Erro ao buscar usuários: {e}")
-            return []
-    
-    def _enviar_notificacao_usuario(self, chat_id_usuario, hoje):
-        """Envia notificação individual para um usuário"""
-        try:
-            logger.info(f"Enviando notificação para usuário {chat_id_usuario}")
-            
-            # Buscar clientes APENAS deste usuário
-            clientes = self.db.listar_clientes(apenas_ativos=True, chat_id_usuario=chat_id_usuario)
-            
-            if not clientes:
-                logger.info(f"Usuário {chat_id_usuario} não tem clientes ativos")
-                return
-            
-            # Categorizar clientes
-            vencidos = []
-            vence_hoje = []
-            vence_proximos = []
-            
-            for cliente in clientes:
-                vencimento = cliente['vencimento']
-                dias_diferenca = (vencimento - hoje).days
-                
-                if dias_diferenca < 0:
-                    vencidos.append(cliente)
-                elif dias_diferenca == 0:
-                    vence_hoje.append(cliente)
-                elif 1 <= dias_diferenca <= 7:
-                    vence_proximos.append(cliente)
-            
-            # Criar mensagem apenas se houver algo importante
-            if vencidos or vence_hoje or vence_proximos:
-                mensagem = f"🚨 *ALERTA DIÁRIO - {hoje.strftime('%d/%m/%Y')}*\n\n"
-                
-                if vencidos:
-                    mensagem += f"🔴 *VENCIDOS ({len(vencidos)}):*\n"
-                    for cliente in vencidos[:3]:
-                        dias_vencido = abs((cliente['vencimento'] - hoje).days)
-                        mensagem += f"• {cliente['nome']} - há {dias_vencido} dia(s)\n"
-                    if len(vencidos) > 3:
-                        mensagem += f"• +{len(vencidos) - 3} outros\n"
-                    mensagem += "\n"
-                
-                if vence_hoje:
-                    mensagem += f"⚠️ *VENCEM HOJE ({len(vence_hoje)}):*\n"
-                    for cliente in vence_hoje:
-                        mensagem += f"• {cliente['nome']} - R$ {cliente['valor']:.2f}\n"
-                    mensagem += "\n"
-                
-                if vence_proximos:
-                    mensagem += f"📅 *PRÓXIMOS 7 DIAS ({len(vence_proximos)}):*\n"
-                    for cliente in vence_proximos[:3]:
-                        dias_restantes = (cliente['vencimento'] - hoje).days
-                        mensagem += f"• {cliente['nome']} - {dias_restantes} dia(s)\n"
-                    if len(vence_proximos) > 3:
-                        mensagem += f"• +{len(vence_proximos) - 3} outros\n"
-                
-                mensagem += f"\n📊 Total de clientes: {len(clientes)}\n"
-                mensagem += "💡 Use /vencimentos para detalhes"
-                
-                # Enviar para o usuário
-                sucesso = self._enviar_telegram(chat_id_usuario, mensagem)
-                if sucesso:
-                    logger.info(f"📱 Notificação enviada com sucesso para usuário {chat_id_usuario}")
-                else:
-                    logger.error(f"Falha ao enviar notificação para usuário {chat_id_usuario}")
-            else:
-                logger.info(f"Usuário {chat_id_usuario} não tem vencimentos próximos")
-            
-        except Exception as e:
-            logger.error(f"Erro ao notificar usuário {chat_id_usuario}: {e}")
+    @staticmethod
+    def _montar_alerta_diario(resumo, hoje):
+        """Texto do alerta diário a partir de uma linha de resumo_vencimentos_usuarios"""
+        destaques = {'vencidos': [], 'hoje': [], 'proximos': []}
+        for cliente in resumo['destaques']:
+            destaques[cliente['faixa']].append(cliente)
+        
+        def outros(faixa):
+            restantes = resumo[faixa] - len(destaques[faixa])
+            return f"• +{restantes} outros\n" if restantes > 0 else ""
+        
+        mensagem = f"🚨 *ALERTA DIÁRIO - {hoje.strftime('%d/%m/%Y')}*\n\n"
+        
+        if resumo['vencidos']:
+            mensagem += f"🔴 *VENCIDOS ({resumo['vencidos']}):*\n"
+            for cliente in destaques['vencidos']:
+                mensagem += f"• {cliente['nome']} - há {abs(cliente['dias'])} dia(s)\n"
+            mensagem += outros('vencidos') + "\n"
+        
+        if resumo['hoje']:
+            mensagem += f"⚠️ *VENCEM HOJE ({resumo['hoje']}):*\n"
+            for cliente in destaques['hoje']:
+                mensagem += f"• {cliente['nome']} - R$ {float(cliente['valor'] or 0):.2f}\n"
+            mensagem += outros('hoje') + "\n"
+        
+        if resumo['proximos']:
+            mensagem += f"📅 *PRÓXIMOS 7 DIAS ({resumo['proximos']}):*\n"
+            for cliente in destaques['proximos']:
+                mensagem += f"• {cliente['nome']} - {cliente['dias']} dia(s)\n"
+            mensagem += outros('proximos')
+        
+        mensagem += f"\n📊 Total de clientes: {resumo['total_clientes']}\n"
+        mensagem += "💡 Use /vencimentos para detalhes"
+        return mensagem
     
     def _enviar_telegram(self, chat_id, mensagem):
         """Envia mensagem via Telegram"""
@@ -454,14 +754,13 @@ class SimpleScheduler:
                 logger.error("BOT_TOKEN não configurado")
                 return False
             
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
             data = {
                 'chat_id': chat_id,
                 'text': mensagem,
                 'parse_mode': 'Markdown'
             }
             
-            response = requests.post(url, data=data, timeout=10)
+            response = get_telegram_client(bot_token).send_message(data, timeout=10)
             
             if response.status_code == 200:
                 return True
@@ -475,7 +774,7 @@ class SimpleScheduler:
     
     def is_running(self):
         """Verifica se agendador está rodando"""
-        return self.running and self.scheduler.running if self.scheduler else False
+        return self.running and self.scheduler.state == STATE_RUNNING if self.scheduler else False
     
     def set_bot_instance(self, bot_instance):
         """Define instância do bot (compatibilidade)"""
@@ -506,12 +805,10 @@ class SimpleScheduler:
     def _setup_main_jobs(self):
         """Compatibilidade: recria jobs principais"""
         try:
+            if not self.is_leader:
+                return True
             logger.info("🔄 Recriando jobs do agendador...")
             
-            # Remove jobs existentes
-            for job in list(self.scheduler.get_jobs()):
-                job.remove()
-            
             # Recria job de notificações
             self.scheduler.add_job(
                 func=self._notificar_usuarios_diario,
@@ -520,6 +817,9 @@ class SimpleScheduler:
                 name='Notificações Diárias 9h05',
                 replace_existing=True
             )
+            self._configurar_job_reenvio()
+            self._configurar_job_reconciliacao()
+            self.reconciliar_jobs()
             
             logger.info("✅ Jobs recriados com sucesso")
             return True
@@ -0,0 +1,169 @@
+"""
+Motor de envio de mensagens WhatsApp
+Pool limitado de workers; sessões diferentes enviam em paralelo e cada sessão respeita seu próprio intervalo anti-ban
+"""
+import os
+import time
+import heapq
+import random
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_SEND_WORKERS = int(os.getenv('WHATSAPP_SEND_WORKERS', '8'))
+WHATSAPP_SEND_JITTER = float(os.getenv('WHATSAPP_SEND_JITTER', '1.0'))
+
+
+def _chamar(func, *args):
+    return func(*args)
+
+
+class SessionSendEngine:
+    """Agenda envios por sessão: no máximo um envio em andamento por sessão e um intervalo entre eles
+
+    O intervalo (delay base + jitter aleatório) é cumprido pelo agendador, não por um
+    sleep na thread de envio, então os workers ficam livres para atender outras sessões.
+    Sem send_func, o primeiro argumento de submit é a própria função de envio.
+    """
+
+    def __init__(self, send_func=None, workers=WHATSAPP_SEND_WORKERS, intervalo=2.0, jitter=WHATSAPP_SEND_JITTER):
+        self.send_func = send_func or _chamar
+        self.num_workers = max(1, workers)
+        self.intervalo = intervalo  # segundos ou função que retorna o intervalo atual
+        self.jitter = max(0.0, jitter)
+
+        self._lock = threading.Lock()
+        self._mudou = threading.Condition(self._lock)
+        self._filas = {}      # sessão -> deque de (chave, args, enfileirado_em); presente enquanto ocupada
+        self._agenda = []     # heap de (liberada_em, seq, sessão) das sessões com itens e sem envio em andamento
+        self._liberada = {}   # sessão ociosa -> quando pode enviar de novo (intervalo do último envio)
+        self._seq = 0
+        self._chaves = set()  # chaves enfileiradas ou em envio (evita envio duplicado)
+        self._ativos = 0
+        self._threads = []
+        self._rodando = False
+
+        self._stats = {
+            'submitted': 0,
+            'duplicates': 0,
+            'sent': 0,
+            'failed': 0,
+            'wait_seconds': 0.0,
+            'send_seconds': 0.0
+        }
+
+    def start(self):
+        """Inicia os workers"""
+        with self._lock:
+            if self._rodando:
+                return
+            self._rodando = True
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"whatsapp-send-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Motor de envio WhatsApp iniciado com {self.num_workers} workers")
+
+    def stop(self, timeout=5):
+        """Sinaliza parada e aguarda os workers terminarem o envio atual"""
+        with self._lock:
+            self._rodando = False
+            self._mudou.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, sessao, chave, *args):
+        """Enfileira send_func(*args) na sessão; retorna False se a chave já estiver na fila"""
+        with self._lock:
+            if chave in self._chaves:
+                self._stats['duplicates'] += 1
+                return False
+            self._chaves.add(chave)
+
+            fila = self._filas.get(sessao)
+            if fila is None:
+                fila = self._filas[sessao] = deque()
+                # Sessão que acabou de esvaziar ainda deve o intervalo do último envio
+                self._agendar(sessao, max(time.monotonic(), self._liberada.pop(sessao, 0.0)))
+            fila.append((chave, args, time.monotonic()))
+            self._stats['submitted'] += 1
+            return True
+
+    def _agendar(self, sessao, liberada_em):
+        self._seq += 1
+        heapq.heappush(self._agenda, (liberada_em, self._seq, sessao))
+        self._mudou.notify()
+
+    def _proximo_intervalo(self):
+        intervalo = self.intervalo() if callable(self.intervalo) else self.intervalo
+        return max(0.0, float(intervalo or 0)) + random.uniform(0, self.jitter)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while True:
+                    if not self._rodando:
+                        return
+                    if not self._agenda:
+                        self._mudou.wait()
+                        continue
+                    espera = self._agenda[0][0] - time.monotonic()
+                    if espera > 0:
+                        self._mudou.wait(espera)
+                        continue
+                    break
+                _, _, sessao = heapq.heappop(self._agenda)
+                chave, args, enfileirado_em = self._filas[sessao].popleft()
+                self._ativos += 1
+                # Outro worker pode ter uma sessão liberada no topo da agenda
+                if self._agenda:
+                    self._mudou.notify()
+
+            inicio = time.monotonic()
+            try:
+                sucesso = bool(self.send_func(*args))
+            except Exception as e:
+                sucesso = False
+                logger.error(f"Erro no envio {chave} da sessão {sessao}: {e}")
+            fim = time.monotonic()
+
+            with self._lock:
+                self._ativos -= 1
+                self._chaves.discard(chave)
+                self._stats['sent' if sucesso else 'failed'] += 1
+                self._stats['wait_seconds'] += inicio - enfileirado_em
+                self._stats['send_seconds'] += fim - inicio
+                liberada_em = fim + self._proximo_intervalo()
+                if self._filas[sessao]:
+                    self._agendar(sessao, liberada_em)
+                else:
+                    del self._filas[sessao]
+                    # Descarta sessões cujo intervalo já passou para manter o dict pequeno
+                    for antiga in [s for s, t in self._liberada.items() if t <= fim]:
+                        del self._liberada[antiga]
+                    self._liberada[sessao] = liberada_em
+
+    def pendentes(self, sessao=None):
+        """Quantidade de envios aguardando (de uma sessão ou de todas)"""
+        with self._lock:
+            if sessao is not None:
+                return len(self._filas.get(sessao, ()))
+            return sum(len(fila) for fila in self._filas.values())
+
+    def stats(self):
+        """Métricas de fila e de envio"""
+        with self._lock:
+            stats = dict(self._stats)
+            concluidos = stats['sent'] + stats['failed']
+            stats.update({
+                'workers': self.num_workers,
+                'active_workers': self._ativos,
+                'pending': sum(len(fila) for fila in self._filas.values()),
+                'sessions_queued': len(self._filas),
+                'avg_wait_ms': round(stats['wait_seconds'] * 1000 / concluidos, 2) if concluidos else 0.0,
+                'avg_send_ms': round(stats['send_seconds'] * 1000 / concluidos, 2) if concluidos else 0.0
+            })
+            return stats
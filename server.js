@@ -10,11 +10,80 @@ const PORT = 3000;
 
 // Middlewares
 app.use(cors());
-app.use(express.json());
+app.use(express.json({ limit: '5mb' })); // lotes de /send-batch podem ter centenas de mensagens
 
 // Estado global para múltiplas sessões - CADA USUÁRIO TEM SUA PRÓPRIA SESSÃO
 const sessions = new Map(); // sessionId -> { sock, qrCode, isConnected, status, backupInterval }
 const connectionLocks = new Map(); // sessionId -> timestamp para evitar conexões simultâneas
+const activeBatches = new Set(); // sessionIds com lote em envio (um lote por sessão)
+const sendQueues = new Map(); // sessionId -> promessa do último envio enfileirado na sessão
+
+// Envio em lote: intervalo entre mensagens e tamanho máximo por requisição
+const BATCH_DELAY_MS = parseInt(process.env.BATCH_DELAY_MS || '2000', 10);
+const BATCH_MAX_ITEMS = parseInt(process.env.BATCH_MAX_ITEMS || '1000', 10);
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Envios avulsos e lotes da mesma sessão passam por uma fila única: um lote em andamento
+// segura a sessão inteira, então /send-message não se intercala com ele nem fura o intervalo
+const withSessionSendLock = (sessionId, task) => {
+    const previous = sendQueues.get(sessionId) || Promise.resolve();
+    const run = previous.then(task);
+    const tail = run.catch(() => {});
+    sendQueues.set(sessionId, tail);
+    tail.then(() => {
+        if (sendQueues.get(sessionId) === tail) sendQueues.delete(sessionId);
+    });
+    return run;
+};
+
+// Verificação de números no WhatsApp: consultas simultâneas por requisição de lote e tamanho máximo
+const CHECK_CONCURRENCY = parseInt(process.env.CHECK_CONCURRENCY || '5', 10);
+const CHECK_MAX_ITEMS = parseInt(process.env.CHECK_MAX_ITEMS || '500', 10);
+
+const checkNumber = async (sock, number) => {
+    const jid = number.includes('@') ? number : `${number}@s.whatsapp.net`;
+    const [result] = await sock.onWhatsApp(jid);
+    return {
+        number: number,
+        exists: !!result?.exists,
+        jid: result?.exists ? result.jid : null
+    };
+};
+
+// Mudanças de conexão são empurradas para a API Python, que mantém o status de cada sessão em memória
+// (PORT é a porta do Flask, herdada do processo Python que inicia este servidor)
+const STATUS_WEBHOOK_URL = process.env.STATUS_WEBHOOK_URL || `http://localhost:${process.env.PORT || 5000}/api/session/event`;
+const STATUS_WEBHOOK_HEADERS = { 'Content-Type': 'application/json' };
+if (process.env.BAILEYS_API_KEY) {
+    STATUS_WEBHOOK_HEADERS['Authorization'] = `Bearer ${process.env.BAILEYS_API_KEY}`;
+}
+const BOOT_ID = `${process.pid}-${Date.now()}`; // permite ao Python descartar eventos fora de ordem
+let statusSeq = 0;
+
+const pushSessionStatus = (sessionId, event, session = sessions.get(sessionId)) => {
+    const payload = {
+        session_id: sessionId,
+        event: event,
+        seq: ++statusSeq,
+        boot_id: BOOT_ID,
+        connected: !!session?.isConnected,
+        status: session?.status || 'not_initialized',
+        session: session?.sock?.user?.id || null,
+        qr_available: !!session?.qrCode,
+        timestamp: new Date().toISOString()
+    };
+    
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), 5000);
+    fetch(STATUS_WEBHOOK_URL, {
+        method: 'POST',
+        headers: STATUS_WEBHOOK_HEADERS,
+        body: JSON.stringify(payload),
+        signal: controller.signal
+    })
+        .catch(err => console.log(`⚠️ Evento ${event} da sessão ${sessionId} não entregue:`, err.message))
+        .finally(() => clearTimeout(timeoutId));
+};
 
 // Sistema ROBUSTO de backup da sessão - com retry e fallback
 const saveSessionToDatabase = async (sessionId, retries = 3) => {
@@ -195,6 +264,7 @@ const connectToWhatsApp = async (sessionId) => {
                 console.log(`📱 QR Code gerado para sessão ${sessionId}!`);
                 session.qrCode = qr;
                 session.status = 'qr_ready';
+                pushSessionStatus(sessionId, 'qr_ready', session);
             }
             
             if (connection === 'close') {
@@ -203,6 +273,7 @@ const connectToWhatsApp = async (sessionId) => {
                 
                 const shouldReconnect = (lastDisconnect?.error)?.output?.statusCode !== DisconnectReason.loggedOut;
                 console.log(`🔌 Sessão ${sessionId} - Conexão fechada. Reconectar?`, shouldReconnect);
+                pushSessionStatus(sessionId, shouldReconnect ? 'close' : 'logged_out', session);
                 
                 // Tratamento de reconexão específico por sessão
                 if ((lastDisconnect?.error)?.output?.statusCode === DisconnectReason.badSession ||
@@ -221,6 +292,7 @@ const connectToWhatsApp = async (sessionId) => {
                 session.status = 'connected';
                 session.qrCode = '';
                 console.log(`✅ Sessão ${sessionId} - WhatsApp conectado!`);
+                pushSessionStatus(sessionId, 'open', session);
                 
                 // Configurar backup automático ROBUSTO (a cada 5 minutos)
                 if (session.backupInterval) clearInterval(session.backupInterval);
@@ -241,6 +313,7 @@ const connectToWhatsApp = async (sessionId) => {
                 if (session.status !== 'connecting') {
                     session.status = 'connecting';
                     console.log(`🔄 Sessão ${sessionId} - Conectando...`);
+                    pushSessionStatus(sessionId, 'connecting', session);
                 }
             }
         });
@@ -559,6 +632,7 @@ app.get('/pairing-code/:sessionId/:phoneNumber', async (req, res) => {
                         session.isConnected = false;
                         session.status = 'disconnected';
                         session.pairingInProgress = false;
+                        pushSessionStatus(sessionId, 'close', session);
                         
                         if (!pairingCodeGenerated) {
                             connectionError = new Error('Connection Closed');
@@ -570,6 +644,7 @@ app.get('/pairing-code/:sessionId/:phoneNumber', async (req, res) => {
                         session.status = 'connected';
                         session.pairingInProgress = false;
                         console.log(`✅ Sessão ${sessionId} - WhatsApp conectado!`);
+                        pushSessionStatus(sessionId, 'open', session);
                     }
                 } catch (error) {
                     session.pairingInProgress = false;
@@ -752,8 +827,14 @@ app.post('/send-message', async (req, res) => {
         // Formatar número
         const jid = number.includes('@') ? number : `${number}@s.whatsapp.net`;
         
-        // Enviar mensagem
-        const result = await session.sock.sendMessage(jid, { text: message });
+        // Enviar mensagem (aguarda a vez da sessão se houver lote em envio)
+        const result = await withSessionSendLock(session_id, () => {
+            const current = sessions.get(session_id);
+            if (!current || !current.isConnected) {
+                throw new Error(`WhatsApp não conectado para sessão ${session_id}`);
+            }
+            return current.sock.sendMessage(jid, { text: message });
+        });
         
         console.log(`✅ Mensagem enviada via sessão ${session_id}:`, number, message.substring(0, 50) + '...');
         
@@ -774,6 +855,171 @@ app.post('/send-message', async (req, res) => {
     }
 });
 
+// Enviar lote de mensagens por uma sessão - resultados por item em NDJSON, uma linha por mensagem
+app.post('/send-batch', async (req, res) => {
+    const { session_id, messages } = req.body;
+    const delayMs = Number.isFinite(req.body.delay_ms) ? Math.max(0, req.body.delay_ms) : BATCH_DELAY_MS;
+    
+    if (!session_id) {
+        return res.status(400).json({
+            success: false,
+            error: 'session_id é obrigatório'
+        });
+    }
+    
+    if (!Array.isArray(messages) || messages.length === 0 || messages.length > BATCH_MAX_ITEMS) {
+        return res.status(400).json({
+            success: false,
+            error: `messages deve ser uma lista com 1 a ${BATCH_MAX_ITEMS} itens`,
+            session_id: session_id
+        });
+    }
+    
+    const session = sessions.get(session_id);
+    
+    if (!session || !session.isConnected) {
+        return res.status(400).json({
+            success: false,
+            error: `WhatsApp não conectado para sessão ${session_id}`,
+            session_id: session_id
+        });
+    }
+    
+    // Dois lotes simultâneos na mesma sessão furariam o intervalo entre mensagens
+    if (activeBatches.has(session_id)) {
+        return res.status(409).json({
+            success: false,
+            error: `Já existe um lote em envio para sessão ${session_id}`,
+            session_id: session_id
+        });
+    }
+    
+    activeBatches.add(session_id);
+    let aborted = false;
+    res.on('close', () => {
+        if (!res.writableEnded) aborted = true;
+    });
+    
+    res.status(200);
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.flushHeaders();
+    
+    let sent = 0;
+    let failed = 0;
+    
+    try {
+        // O lote segura a fila da sessão até a última mensagem
+        await withSessionSendLock(session_id, async () => {
+            for (let i = 0; i < messages.length && !aborted; i++) {
+                const { id, number, message } = messages[i] || {};
+                const result = { index: i, id: id ?? null, number: number || null };
+                let attempted = false;
+            
+                const current = sessions.get(session_id);
+                if (!number || !message) {
+                    result.success = false;
+                    result.error = 'Número e mensagem são obrigatórios';
+                } else if (!current || !current.isConnected) {
+                    result.success = false;
+                    result.error = `WhatsApp não conectado para sessão ${session_id}`;
+                } else {
+                    attempted = true;
+                    try {
+                        const jid = number.includes('@') ? number : `${number}@s.whatsapp.net`;
+                        const sendResult = await current.sock.sendMessage(jid, { text: message });
+                        result.success = true;
+                        result.messageId = sendResult.key.id;
+                        result.timestamp = new Date().toISOString();
+                    } catch (error) {
+                        result.success = false;
+                        result.error = error.message;
+                    }
+                }
+            
+                if (result.success) sent++; else failed++;
+                res.write(JSON.stringify(result) + '\n');
+            
+                if (attempted && i < messages.length - 1 && delayMs > 0) {
+                    await sleep(delayMs);
+                }
+            }
+        });
+        
+        console.log(`📦 Lote da sessão ${session_id}: ${sent} enviadas, ${failed} falharam${aborted ? ' (cliente desconectou)' : ''}`);
+        
+        if (!aborted) {
+            res.end(JSON.stringify({
+                done: true,
+                total: messages.length,
+                sent: sent,
+                failed: failed,
+                session_id: session_id
+            }) + '\n');
+        }
+    } catch (error) {
+        console.error(`❌ Erro no lote da sessão ${session_id}:`, error);
+        res.end(JSON.stringify({ done: true, error: error.message, session_id: session_id }) + '\n');
+    } finally {
+        activeBatches.delete(session_id);
+    }
+});
+
+// Verificar vários números de uma vez - resultados com exists=null para os que falharem
+app.post('/check-numbers', async (req, res) => {
+    const { session_id, numbers } = req.body;
+    
+    try {
+        if (!session_id) {
+            return res.status(400).json({
+                success: false,
+                error: 'session_id é obrigatório'
+            });
+        }
+        
+        if (!Array.isArray(numbers) || numbers.length === 0 || numbers.length > CHECK_MAX_ITEMS) {
+            return res.status(400).json({
+                success: false,
+                error: `numbers deve ser uma lista com 1 a ${CHECK_MAX_ITEMS} itens`,
+                session_id: session_id
+            });
+        }
+        
+        const session = sessions.get(session_id);
+        
+        if (!session || !session.isConnected) {
+            return res.status(400).json({
+                success: false,
+                error: `WhatsApp não conectado para sessão ${session_id}`,
+                session_id: session_id
+            });
+        }
+        
+        const results = [];
+        for (let i = 0; i < numbers.length; i += CHECK_CONCURRENCY) {
+            const chunk = numbers.slice(i, i + CHECK_CONCURRENCY);
+            results.push(...await Promise.all(chunk.map(async (number) => {
+                try {
+                    return await checkNumber(session.sock, String(number));
+                } catch (error) {
+                    return { number: number, exists: null, jid: null, error: error.message };
+                }
+            })));
+        }
+        
+        console.log(`🔎 Sessão ${session_id}: ${results.length} números verificados`);
+        res.json({ success: true, results: results, session_id: session_id });
+        
+    } catch (error) {
+        console.error(`❌ Erro ao verificar números:`, error);
+        res.status(500).json({
+            success: false,
+            error: error.message,
+            session_id: session_id || null
+        });
+    }
+});
+
 // Reconectar sessão específica
 app.post('/reconnect/:sessionId', async (req, res) => {
     try {
@@ -843,6 +1089,7 @@ app.post('/clear-session/:sessionId', async (req, res) => {
                 clearInterval(session.backupInterval);
             }
             sessions.delete(sessionId);
+            pushSessionStatus(sessionId, 'cleared', null);
         }
         
         // Limpar auth_info específico da sessão
@@ -1011,6 +1258,8 @@ app.listen(PORT, () => {
     console.log('   GET  /status/:sessionId - Status da sessão');
     console.log('   GET  /qr/:sessionId - QR Code da sessão');
     console.log('   POST /send-message - Enviar mensagem');
+    console.log('   POST /send-batch - Enviar lote de mensagens (resultados em NDJSON)');
+    console.log('   POST /check-numbers - Verificar números no WhatsApp');
     console.log('   POST /reconnect/:sessionId - Reconectar sessão');
     console.log('   POST /clear-session/:sessionId - Limpar sessão');
     console.log('   GET  /sessions - Listar todas as sessões');
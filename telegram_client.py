@@ -0,0 +1,245 @@
+"""
+Cliente HTTP da Bot API do Telegram
+Mantém uma única sessão com pool de conexões keep-alive compartilhada por todo o processo
+"""
+import os
+import logging
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '20'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '2'))
+
+# Limites de envio da Bot API: ~30 msg/s no total e ~1 msg/s por chat (0 desativa)
+TELEGRAM_RATE_GLOBAL = float(os.getenv('TELEGRAM_RATE_GLOBAL', '30'))
+TELEGRAM_RATE_PER_CHAT = float(os.getenv('TELEGRAM_RATE_PER_CHAT', '1'))
+TELEGRAM_BURST_PER_CHAT = float(os.getenv('TELEGRAM_BURST_PER_CHAT', '3'))
+TELEGRAM_429_MAX_RETRIES = int(os.getenv('TELEGRAM_429_MAX_RETRIES', '5'))
+
+# Métodos que entregam conteúdo a um chat e contam para os limites de envio
+METODOS_ENVIO = frozenset({
+    'sendMessage', 'sendPhoto', 'sendDocument', 'sendAudio', 'sendVideo', 'sendAnimation',
+    'sendVoice', 'sendSticker', 'sendLocation', 'sendContact', 'sendMediaGroup',
+    'forwardMessage', 'copyMessage', 'editMessageText', 'editMessageCaption',
+    'editMessageReplyMarkup'
+})
+
+
+class TokenBucket:
+    """Balde de tokens com reserva: quem chega com o balde vazio recebe o tempo de espera"""
+
+    def __init__(self, rate, capacity, agora):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.atualizado = agora
+        self.bloqueado_ate = 0.0
+
+    def reservar(self, agora):
+        """Consome um token e retorna quantos segundos aguardar até poder usá-lo"""
+        self.tokens = min(self.capacity, self.tokens + (agora - self.atualizado) * self.rate)
+        self.atualizado = agora
+        self.tokens -= 1
+        espera = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(espera, self.bloqueado_ate - agora)
+
+    def ocioso(self, agora):
+        return agora >= self.bloqueado_ate and \
+            self.tokens + (agora - self.atualizado) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """Limitador global + por chat para os envios da Bot API"""
+
+    MAX_BALDES_CHAT = 10000
+
+    def __init__(self, global_rate=TELEGRAM_RATE_GLOBAL, chat_rate=TELEGRAM_RATE_PER_CHAT,
+                 chat_burst=TELEGRAM_BURST_PER_CHAT):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = max(1.0, chat_burst)
+        self._lock = threading.Lock()
+        agora = time.monotonic()
+        self._global = TokenBucket(global_rate, max(1.0, global_rate), agora) if global_rate > 0 else None
+        self._chats = {}
+        self._stats = {'acquired': 0, 'delayed': 0, 'delay_seconds': 0.0, 'throttled_429': 0}
+
+    def _balde_chat(self, chat_id, agora):
+        balde = self._chats.get(chat_id)
+        if balde is None:
+            if len(self._chats) >= self.MAX_BALDES_CHAT:
+                # Baldes cheios equivalem a um balde novo e podem ser descartados
+                for chave in [c for c, b in self._chats.items() if b.ocioso(agora)]:
+                    del self._chats[chave]
+            balde = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, agora)
+        return balde
+
+    def aguardar(self, chat_id=None):
+        """Bloqueia a thread até o envio para o chat estar dentro dos limites"""
+        with self._lock:
+            agora = time.monotonic()
+            espera = 0.0
+            if self._global:
+                espera = self._global.reservar(agora)
+            if chat_id is not None and self.chat_rate > 0:
+                espera = max(espera, self._balde_chat(chat_id, agora).reservar(agora))
+            self._stats['acquired'] += 1
+            if espera > 0:
+                self._stats['delayed'] += 1
+                self._stats['delay_seconds'] += espera
+        if espera > 0:
+            time.sleep(espera)
+
+    def bloquear(self, chat_id, segundos):
+        """Aplica o retry_after de um 429 ao chat (ou a todos, se o chat não for conhecido)"""
+        with self._lock:
+            agora = time.monotonic()
+            self._stats['throttled_429'] += 1
+            if chat_id is not None and self.chat_rate > 0:
+                balde = self._balde_chat(chat_id, agora)
+            elif self._global:
+                balde = self._global
+            else:
+                return
+            balde.bloqueado_ate = max(balde.bloqueado_ate, agora + segundos)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['chat_buckets'] = len(self._chats)
+            return stats
+
+
+class TelegramClient:
+    """Cliente da Bot API com sessão HTTP persistente (TLS reaproveitado entre chamadas)"""
+
+    def __init__(self, token, api_url=None, pool_size=None, max_retries=None):
+        self.token = token
+        self.api_url = (api_url or TELEGRAM_API_URL).rstrip('/')
+        self.base_url = f"{self.api_url}/bot{token}"
+        pool_size = pool_size or TELEGRAM_POOL_SIZE
+        max_retries = TELEGRAM_MAX_RETRIES if max_retries is None else max_retries
+
+        # Falhas de conexão (requisição nem chegou ao Telegram) são repetidas para qualquer método;
+        # erros de gateway só para métodos idempotentes (allowed_methods padrão), pois um POST
+        # de envio pode ter sido aceito antes do 502/503/504 e repeti-lo duplicaria a mensagem.
+        # Respostas 4xx (inclusive 429) são devolvidas ao chamador
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(502, 503, 504),
+            backoff_factor=0.3,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry, pool_block=False)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.limiter = RateLimiter()
+
+    def url(self, method):
+        """Monta a URL de um método da Bot API"""
+        return f"{self.base_url}/{method}"
+
+    def request(self, method, http_method='POST', timeout=10, **kwargs):
+        """Executa um método da Bot API e retorna o objeto Response
+
+        Métodos de envio passam pelo limitador e, em caso de 429, aguardam o
+        retry_after informado pelo Telegram e repetem a chamada.
+        """
+        if method not in METODOS_ENVIO:
+            return self.session.request(http_method, self.url(method), timeout=timeout, **kwargs)
+
+        chat_id = self._chat_id(kwargs)
+        for tentativa in range(TELEGRAM_429_MAX_RETRIES + 1):
+            self.limiter.aguardar(chat_id)
+            response = self.session.request(http_method, self.url(method), timeout=timeout, **kwargs)
+            if response.status_code != 429 or tentativa == TELEGRAM_429_MAX_RETRIES:
+                return response
+            retry_after = self._retry_after(response)
+            logger.warning(f"Telegram 429 em {method} (chat {chat_id}): aguardando {retry_after}s")
+            self.limiter.bloquear(chat_id, retry_after)
+            self._rebobinar_arquivos(kwargs.get('files'))
+        return response
+
+    @staticmethod
+    def _chat_id(kwargs):
+        payload = kwargs.get('data') or kwargs.get('json') or kwargs.get('params') or {}
+        chat_id = payload.get('chat_id') if isinstance(payload, dict) else None
+        return str(chat_id) if chat_id is not None else None
+
+    @staticmethod
+    def _retry_after(response):
+        """Segundos pedidos pelo Telegram (parameters.retry_after ou cabeçalho Retry-After)"""
+        try:
+            return float(response.json().get('parameters', {}).get('retry_after'))
+        except Exception:
+            pass
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return 1.0
+
+    @staticmethod
+    def _rebobinar_arquivos(files):
+        """Volta os streams de upload ao início antes de reenviar"""
+        for arquivo in (files or {}).values():
+            stream = arquivo[1] if isinstance(arquivo, tuple) else arquivo
+            if hasattr(stream, 'seek'):
+                stream.seek(0)
+
+    def call(self, method, timeout=10, **kwargs):
+        """Executa um método da Bot API e retorna o JSON decodificado"""
+        response = self.request(method, timeout=timeout, **kwargs)
+        if response.status_code != 200:
+            logger.error(f"Erro Telegram {method}: {response.status_code} - {response.text}")
+        return response.json()
+
+    def get_me(self, timeout=10):
+        """Consulta os dados do bot"""
+        return self.request('getMe', http_method='GET', timeout=timeout)
+
+    def get_updates(self, params=None, timeout=10):
+        """Busca updates pendentes"""
+        return self.request('getUpdates', http_method='GET', params=params, timeout=timeout)
+
+    def send_message(self, data, timeout=10):
+        """Envia mensagem de texto (form data)"""
+        return self.request('sendMessage', data=data, timeout=timeout)
+
+    def send_photo(self, data, files, timeout=30):
+        """Envia foto via multipart"""
+        return self.request('sendPhoto', data=data, files=files, timeout=timeout)
+
+    def close(self):
+        """Fecha as conexões do pool"""
+        try:
+            self.session.close()
+        except Exception as e:
+            logger.error(f"Erro ao fechar sessão do Telegram: {e}")
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_telegram_client(token):
+    """Retorna o cliente compartilhado para o token informado"""
+    client = _clients.get(token)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(token)
+            if client is None:
+                client = TelegramClient(token)
+                _clients[token] = client
+    return client
@@ -233,16 +233,18 @@ class TemplateManager:
     def _obter_configuracoes_empresa(self):
         """Obtém configurações da empresa do banco de dados"""
         try:
-            config = {}
-            
-            # Buscar configurações principais
-            config['empresa_nome'] = self.db.obter_configuracao('empresa_nome', '[CONFIGURAR EMPRESA]')
-            config['empresa_telefone'] = self.db.obter_configuracao('empresa_telefone', '[CONFIGURAR TELEFONE]')
-            config['empresa_email'] = self.db.obter_configuracao('empresa_email', '[CONFIGURAR EMAIL]')
-            config['suporte_telefone'] = self.db.obter_configuracao('suporte_telefone', '[CONFIGURAR SUPORTE]')
-            config['suporte_email'] = self.db.obter_configuracao('suporte_email', '[CONFIGURAR EMAIL SUPORTE]')
-            config['pix_chave'] = self.db.obter_configuracao('pix_chave', '[CONFIGURAR PIX]')
-            config['pix_beneficiario'] = self.db.obter_configuracao('pix_beneficiario', '[CONFIGURAR BENEFICIÁRIO]')
+            # Uma única leitura (em cache) em vez de uma consulta por chave
+            salvas = self.db.obter_configuracoes()
+            padroes = {
+                'empresa_nome': '[CONFIGURAR EMPRESA]',
+                'empresa_telefone': '[CONFIGURAR TELEFONE]',
+                'empresa_email': '[CONFIGURAR EMAIL]',
+                'suporte_telefone': '[CONFIGURAR SUPORTE]',
+                'suporte_email': '[CONFIGURAR EMAIL SUPORTE]',
+                'pix_chave': '[CONFIGURAR PIX]',
+                'pix_beneficiario': '[CONFIGURAR BENEFICIÁRIO]'
+            }
+            config = {chave: salvas.get(chave, padrao) for chave, padrao in padroes.items()}
             
             return config
             
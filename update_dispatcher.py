@@ -0,0 +1,191 @@
+"""
+Despachante de updates do Telegram
+Pool de workers que processa chats diferentes em paralelo mantendo a ordem dentro de cada chat
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '8'))
+BOT_QUEUE_SIZE = int(os.getenv('BOT_QUEUE_SIZE', '1000'))
+
+
+def chave_do_update(update):
+    """Chave de ordenação do update: o chat de origem (ou o próprio update se não houver)"""
+    for campo in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        mensagem = update.get(campo)
+        if mensagem and mensagem.get('chat'):
+            return mensagem['chat'].get('id')
+
+    callback = update.get('callback_query')
+    if callback:
+        mensagem = callback.get('message') or {}
+        if mensagem.get('chat'):
+            return mensagem['chat'].get('id')
+        return (callback.get('from') or {}).get('id')
+
+    for campo in ('inline_query', 'chosen_inline_result', 'pre_checkout_query', 'shipping_query'):
+        origem = update.get(campo)
+        if origem:
+            return (origem.get('from') or {}).get('id')
+
+    return ('update', update.get('update_id'))
+
+
+class UpdateDispatcher:
+    """Fila limitada com uma sub-fila por chat; cada chat é atendido por no máximo um worker por vez"""
+
+    def __init__(self, handler, workers=BOT_WORKERS, max_pending=BOT_QUEUE_SIZE, key_func=chave_do_update):
+        self.handler = handler
+        self.num_workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.key_func = key_func
+
+        self._lock = threading.Lock()
+        self._tem_trabalho = threading.Condition(self._lock)
+        self._tem_espaco = threading.Condition(self._lock)
+        self._concluiu = threading.Condition(self._lock)
+        self._filas = {}        # chave -> deque de (update, on_done, enfileirado_em); presente enquanto ocupada
+        self._prontas = deque()  # chaves com itens e sem worker atendendo
+        self._pendentes = 0
+        self._ativos = 0
+        self._threads = []
+        self._rodando = False
+
+        self._stats = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'blocked_submits': 0,
+            'blocked_seconds': 0.0,
+            'max_pending': 0,
+            'wait_seconds': 0.0,
+            'handle_seconds': 0.0
+        }
+
+    def start(self):
+        """Inicia os workers"""
+        with self._lock:
+            if self._rodando:
+                return
+            self._rodando = True
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"update-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Despachante de updates iniciado com {self.num_workers} workers "
+                    f"(fila máx. {self.max_pending})")
+
+    def stop(self, timeout=5):
+        """Sinaliza parada e aguarda os workers terminarem o item atual"""
+        with self._lock:
+            self._rodando = False
+            self._tem_trabalho.notify_all()
+            self._tem_espaco.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, update, timeout=None, on_done=None):
+        """Enfileira update; bloqueia enquanto a fila estiver cheia
+
+        timeout=None espera indefinidamente (backpressure no polling); com timeout,
+        retorna False se não houver espaço a tempo (webhook responde 503 e o Telegram reenvia).
+        on_done(update) é chamado após o processamento, com sucesso ou erro.
+        """
+        chave = self.key_func(update)
+        with self._lock:
+            if self._pendentes >= self.max_pending:
+                self._stats['blocked_submits'] += 1
+                inicio = time.monotonic()
+                limite = None if timeout is None else inicio + timeout
+                while self._rodando and self._pendentes >= self.max_pending:
+                    restante = None if limite is None else limite - time.monotonic()
+                    if restante is not None and restante <= 0:
+                        break
+                    self._tem_espaco.wait(restante)
+                self._stats['blocked_seconds'] += time.monotonic() - inicio
+
+            if not self._rodando or self._pendentes >= self.max_pending:
+                self._stats['rejected'] += 1
+                return False
+
+            fila = self._filas.get(chave)
+            if fila is None:
+                fila = self._filas[chave] = deque()
+                self._prontas.append(chave)
+                self._tem_trabalho.notify()
+            fila.append((update, on_done, time.monotonic()))
+
+            self._pendentes += 1
+            self._stats['submitted'] += 1
+            self._stats['max_pending'] = max(self._stats['max_pending'], self._pendentes)
+            return True
+
+    def aguardar_conclusao(self, timeout):
+        """Bloqueia até algum update terminar (ou o timeout expirar)"""
+        with self._lock:
+            if self._pendentes:
+                self._concluiu.wait(timeout)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while self._rodando and not self._prontas:
+                    self._tem_trabalho.wait()
+                if not self._rodando:
+                    return
+                chave = self._prontas.popleft()
+                update, on_done, enfileirado_em = self._filas[chave].popleft()
+                self._ativos += 1
+
+            inicio = time.monotonic()
+            sucesso = True
+            try:
+                self.handler(update)
+            except Exception as e:
+                sucesso = False
+                logger.error(f"Erro ao processar update {update.get('update_id')}: {e}")
+            fim = time.monotonic()
+
+            if on_done:
+                try:
+                    on_done(update)
+                except Exception as e:
+                    logger.error(f"Erro no callback do update {update.get('update_id')}: {e}")
+
+            with self._lock:
+                self._ativos -= 1
+                self._pendentes -= 1
+                self._stats['processed' if sucesso else 'failed'] += 1
+                self._stats['wait_seconds'] += inicio - enfileirado_em
+                self._stats['handle_seconds'] += fim - inicio
+                # Próximo update do mesmo chat volta ao fim da fila de prontas (justiça entre chats)
+                if self._filas[chave]:
+                    self._prontas.append(chave)
+                    self._tem_trabalho.notify()
+                else:
+                    del self._filas[chave]
+                self._tem_espaco.notify()
+                self._concluiu.notify_all()
+
+    def stats(self):
+        """Métricas de fila e de backpressure"""
+        with self._lock:
+            stats = dict(self._stats)
+            concluidos = stats['processed'] + stats['failed']
+            stats.update({
+                'workers': self.num_workers,
+                'active_workers': self._ativos,
+                'pending': self._pendentes,
+                'capacity': self.max_pending,
+                'chats_queued': len(self._filas),
+                'avg_wait_ms': round(stats['wait_seconds'] * 1000 / concluidos, 2) if concluidos else 0.0,
+                'avg_handle_ms': round(stats['handle_seconds'] * 1000 / concluidos, 2) if concluidos else 0.0
+            })
+            return stats
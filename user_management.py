@@ -4,13 +4,20 @@ Sistema de Gerenciamento de Usuários
 Controla cadastro, período de teste, pagamentos e acesso ao sistema
 """
 import os
+import time
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import pytz
 from database import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
+# Decisões de acesso positivas ficam em memória por até ACESSO_CACHE_TTL segundos
+ACESSO_CACHE_TTL = float(os.getenv('ACESSO_CACHE_TTL', '300'))
+ACESSO_CACHE_MAX = int(os.getenv('ACESSO_CACHE_MAX', '10000'))
+
 class UserManager:
     """Gerencia usuários, teste gratuito e controle de acesso"""
     
@@ -19,6 +26,9 @@ class UserManager:
         self.timezone_br = pytz.timezone('America/Sao_Paulo')
         self.valor_mensal = 20.00
         self.dias_teste_gratuito = 7
+        # chat_id -> (tipo, expira_em, usuario, valido_ate)
+        self._cache_acesso = OrderedDict()
+        self._cache_acesso_lock = threading.Lock()
         
     def cadastrar_usuario(self, chat_id, nome, email, telefone):
         """Cadastra novo usuário com período de teste gratuito"""
@@ -81,6 +91,10 @@ class UserManager:
     
     def verificar_acesso(self, chat_id):
         """Verifica se usuário tem acesso ao sistema"""
+        acesso = self._acesso_em_cache(chat_id)
+        if acesso:
+            return acesso
+        
         try:
             usuario = self.obter_usuario(chat_id)
             if not usuario:
@@ -96,6 +110,7 @@ class UserManager:
                 
                 if agora <= fim_periodo_teste:
                     dias_restantes = (fim_periodo_teste - agora).days
+                    self._guardar_acesso(chat_id, 'teste', fim_periodo_teste, usuario)
                     return {
                         'acesso': True, 
                         'tipo': 'teste',
@@ -116,6 +131,7 @@ class UserManager:
                     
                     if agora <= proximo_vencimento:
                         dias_restantes = (proximo_vencimento - agora).days
+                        self._guardar_acesso(chat_id, 'pago', proximo_vencimento, usuario)
                         return {
                             'acesso': True, 
                             'tipo': 'pago',
@@ -134,11 +150,44 @@ class UserManager:
             logger.error(f"Erro ao verificar acesso: {e}")
             return {'acesso': False, 'motivo': 'erro_interno'}
     
+    def _acesso_em_cache(self, chat_id):
+        """Decisão de acesso positiva em cache, válida até o TTL ou o vencimento do usuário"""
+        with self._cache_acesso_lock:
+            entrada = self._cache_acesso.get(chat_id)
+            if not entrada:
+                return None
+            tipo, expira_em, usuario, valido_ate = entrada
+            agora = datetime.now(self.timezone_br)
+            if time.monotonic() > valido_ate or agora > expira_em:
+                # Vencimento passou: a próxima verificação vai ao banco e atualiza o status
+                del self._cache_acesso[chat_id]
+                return None
+            self._cache_acesso.move_to_end(chat_id)
+        return {
+            'acesso': True,
+            'tipo': tipo,
+            'dias_restantes': (expira_em - agora).days,
+            'usuario': usuario
+        }
+    
+    def _guardar_acesso(self, chat_id, tipo, expira_em, usuario):
+        with self._cache_acesso_lock:
+            self._cache_acesso[chat_id] = (tipo, expira_em, usuario, time.monotonic() + ACESSO_CACHE_TTL)
+            self._cache_acesso.move_to_end(chat_id)
+            while len(self._cache_acesso) > ACESSO_CACHE_MAX:
+                self._cache_acesso.popitem(last=False)
+    
+    def invalidar_cache_acesso(self, chat_id):
+        """Descarta a decisão de acesso em cache após mudança de plano/status"""
+        with self._cache_acesso_lock:
+            self._cache_acesso.pop(chat_id, None)
+    
     def atualizar_status_usuario(self, chat_id, status, plano_ativo):
         """Atualiza status e plano ativo do usuário"""
         try:
             query = "UPDATE usuarios SET status = %s, plano_ativo = %s WHERE chat_id = %s"
             self.db.execute_query(query, [status, plano_ativo, chat_id])
+            self.invalidar_cache_acesso(chat_id)
             logger.info(f"Status do usuário {chat_id} atualizado para: {status}")
         except Exception as e:
             logger.error(f"Erro ao atualizar status do usuário: {e}")
@@ -164,6 +213,7 @@ class UserManager:
             valores.append(chat_id)
             
             self.db.execute_query(query, valores)
+            self.invalidar_cache_acesso(chat_id)
             
             logger.info(f"Dados do usuário {chat_id} atualizados: {list(kwargs.keys())}")
             
@@ -196,6 +246,7 @@ class UserManager:
             self.db.execute_query(query, [
                 'pago', True, agora, proximo_vencimento, valor_pago, chat_id
             ])
+            self.invalidar_cache_acesso(chat_id)
             
             # Registrar pagamento
             self.registrar_pagamento(chat_id, valor_pago, referencia_pagamento)
@@ -216,6 +267,7 @@ class UserManager:
         """Ativa plano mensal após confirmação de pagamento (alias para processar_pagamento)"""
         try:
             logger.info(f"🔥 Ativando plano para usuário {chat_id} com payment_id {payment_id}")
+            self.invalidar_cache_acesso(chat_id)
             resultado = self.processar_pagamento(chat_id, valor, payment_id)
             
             if resultado.get('success'):
@@ -4,6 +4,7 @@ API para backup e restauração de sessões WhatsApp
 Salva dados da sessão no PostgreSQL para persistência entre deploys
 """
 
+import hmac
 import json
 import logging
 import psycopg2.extras
@@ -130,6 +131,17 @@ class WhatsAppSessionManager:
 # Instância global do gerenciador
 session_manager = None
 
+# Funções chamadas a cada mudança de conexão informada pelo servidor Baileys
+status_listeners = []
+
+# Mesma chave que a BaileysAPI usa com o servidor Node; quando definida, os eventos de status exigem
+BAILEYS_API_KEY = os.getenv('BAILEYS_API_KEY', '')
+
+def register_status_listener(listener):
+    """Registra função que recebe os eventos de status das sessões"""
+    if listener not in status_listeners:
+        status_listeners.append(listener)
+
 def init_session_manager(db_manager):
     """Inicializa o gerenciador de sessões"""
     global session_manager
@@ -198,23 +210,26 @@ def restore_session():
 def list_sessions():
     """Lista todas as sessões salvas no banco"""
     try:
-        with DatabaseManager() as db:
-            with db.get_connection() as conn:
-                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                    cursor.execute("""
-                        SELECT DISTINCT session_id, numero_whatsapp, updated_at, chat_id_usuario
-                        FROM whatsapp_sessions 
-                        ORDER BY updated_at DESC
-                    """)
-                    
-                    sessions = cursor.fetchall()
-                    sessions_list = [dict(session) for session in sessions]
-                    
-                    return jsonify({
-                        'success': True,
-                        'sessions': sessions_list,
-                        'total': len(sessions_list)
-                    })
+        if not session_manager:
+            return jsonify({'success': False, 'error': 'Session manager não inicializado'}), 500
+        
+        # Usa o pool compartilhado em vez de abrir um DatabaseManager por requisição
+        with session_manager.db.get_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT DISTINCT session_id, numero_whatsapp, updated_at, chat_id_usuario
+                    FROM whatsapp_sessions 
+                    ORDER BY updated_at DESC
+                """)
+                
+                sessions = cursor.fetchall()
+                sessions_list = [dict(session) for session in sessions]
+                
+                return jsonify({
+                    'success': True,
+                    'sessions': sessions_list,
+                    'total': len(sessions_list)
+                })
         
     except Exception as e:
         logger.error(f"Erro ao listar sessões: {e}")
@@ -242,6 +257,27 @@ def delete_session():
         logger.error(f"Erro ao deletar sessão: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@session_api.route('/api/session/event', methods=['POST'])
+def session_event():
+    """Recebe mudança de conexão de uma sessão (open, close, QR pronto, logout)"""
+    try:
+        if BAILEYS_API_KEY and not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                       f'Bearer {BAILEYS_API_KEY}'.encode()):
+            return jsonify({'success': False, 'error': 'Não autorizado'}), 401
+        
+        data = request.get_json(silent=True)
+        if not data or not data.get('session_id'):
+            return jsonify({'success': False, 'error': 'session_id é obrigatório'}), 400
+        
+        for listener in status_listeners:
+            listener(data)
+        
+        return jsonify({'success': True})
+        
+    except Exception as e:
+        logger.error(f"Erro ao processar evento de sessão: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @session_api.route('/api/session/status', methods=['GET'])
 def session_status():
     """Status das sessões armazenadas"""